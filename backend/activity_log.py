@@ -0,0 +1,130 @@
+from typing import Any, Callable, ContextManager, Optional
+import asyncio
+import logging
+
+from starlette.concurrency import run_in_threadpool
+
+from models import ActivityCreate
+from metrics import ACTIVITY_QUEUE_DEPTH, ACTIVITY_WRITE_BATCH
+
+logger = logging.getLogger(__name__)
+
+# Activity log entries are committed with the write they describe, in the
+# route's own transaction, but only to the activity backlog (see
+# database.Transaction): an append and one fsync, not a rewrite of
+# activities.json. A background task flushes the backlog into activities.json
+# every flush_interval seconds, or sooner once batch_size entries are
+# waiting, so the record and its audit entry stay atomic and durable while
+# the full rewrite happens off the request path.
+#
+# The backlog is bounded: when the flushes fall behind, log() waits for one
+# instead of letting the backlog grow. stop() flushes whatever is left.
+
+Write = Callable[[Any], Any]
+
+class ActivityWriter:
+    def __init__(
+        self,
+        write: Callable[..., object],
+        flush: Callable[[], int],
+        pending: Callable[[], int],
+        transaction: Callable[[], ContextManager[Any]],
+        max_queue: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 1.0
+    ):
+        # write(activities, tx=tx) stages activity log entries, flush() moves
+        # the backlog into the log and pending() counts the backlog
+        self.write = write
+        self.flush = flush
+        self.pending = pending
+        self.transaction = transaction
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # The backlog length as of this worker's last commit, flush or check
+        self._pending = 0
+        self._failure: Optional[Exception] = None
+        self._stopping = False
+        self._wake: Optional[asyncio.Event] = None
+        self._flushed: Optional[asyncio.Condition] = None
+        self._task: Optional[asyncio.Task] = None
+        ACTIVITY_QUEUE_DEPTH.set_function(pending)
+
+    def start(self):
+        # Entries left by a previous run are flushed on the first tick
+        self._pending = self.pending()
+        self._stopping = False
+        self._wake = asyncio.Event()
+        self._flushed = asyncio.Condition()
+        self._task = asyncio.create_task(self._run())
+
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def log(self, activity: ActivityCreate, write: Optional[Write] = None) -> Any:
+        """Commit activity, and write(tx) if given, in one transaction.
+
+        Returns what write returned; raises what it raised.
+        """
+        while self._pending >= self.max_queue and self.running():
+            await self._wait_for_flush()
+        value, self._pending = await run_in_threadpool(self._commit, activity, write)
+        if not self.running():
+            # Outside the app's lifespan, or the task failed: flush directly
+            await run_in_threadpool(self.flush)
+            self._pending = 0
+        elif self._pending >= self.batch_size:
+            self._wake.set()
+        return value
+
+    async def stop(self):
+        # The task flushes once more before it exits
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wake.set()
+        task, self._task = self._task, None
+        await task
+
+    async def _wait_for_flush(self):
+        async with self._flushed:
+            self._wake.set()
+            await self._flushed.wait()
+        if self._failure is not None:
+            raise self._failure
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            stopping = self._stopping
+            if not self._pending:
+                # Bulk imports, batch decisions and grant expiry log
+                # through their own transactions, not log()
+                self._pending = await run_in_threadpool(self.pending)
+            if self._pending or stopping:
+                try:
+                    count = await run_in_threadpool(self.flush)
+                except Exception as exc:
+                    # The backlog is kept, so the next tick retries it
+                    logger.exception("Activity writer failed to flush the backlog")
+                    self._failure = exc
+                else:
+                    self._failure = None
+                    self._pending = 0
+                    if count:
+                        ACTIVITY_WRITE_BATCH.observe(count)
+                async with self._flushed:
+                    self._flushed.notify_all()
+            if stopping:
+                return
+
+    def _commit(self, activity: ActivityCreate, write: Optional[Write]):
+        with self.transaction() as tx:
+            value = write(tx) if write is not None else None
+            self.write([activity], tx=tx)
+        return value, self.pending()
@@ -0,0 +1,249 @@
+from typing import Any, BinaryIO, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from datetime import datetime, timezone
+import json
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+from indexes import Stamp, file_stamp
+
+# Column-wise copy of the activity log for dashboard aggregations.
+# Each activity is a row across four NumPy columns: its timestamp
+# (datetime64, seconds) and integer codes for its type, acting user and
+# dataset (-1 when absent). Filters become boolean masks and group-bys become
+# bincount/unique over the masked codes, so no query touches Python objects
+# per activity.
+#
+# activities.json stays the source of truth. The columns are rebuilt from it
+# when it changes on disk and appended to when this process writes it (the
+# same hooks as indexes.CollectionIndex). After a rebuild they are saved as
+# .npy files next to it, and a later start with an unchanged activities.json
+# memory-maps those instead of parsing the JSON.
+
+ACTIVITY_GROUPINGS = ("type", "dataset", "user", "hour", "day", "week", "month")
+
+# datetime64 units for time groupings; weeks are handled separately because
+# NumPy weeks start on Thursday
+TIME_UNITS = {"hour": "h", "day": "D", "month": "M"}
+
+class Categories:
+    """Interned values of one categorical column, as dense integer codes."""
+
+    def __init__(self, values: Iterable[str] = ()):
+        self.values: List[str] = list(values)
+        self.codes: Dict[str, int] = {value: code for code, value in enumerate(self.values)}
+
+    def code(self, value: Optional[str]) -> int:
+        if value is None:
+            return -1
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def encode(self, values: Iterable[Optional[str]]) -> np.ndarray:
+        return np.fromiter((self.code(value) for value in values), dtype=np.int32)
+
+class ActivityColumns:
+    COLUMNS = {
+        "timestamp": "datetime64[s]",
+        "type": np.int32,
+        "user": np.int32,
+        "dataset": np.int32,
+    }
+
+    def __init__(self, file_path: str, load: Callable[[str], List[Dict[str, Any]]], directory: str):
+        self.file_path = file_path
+        self.directory = directory
+        self._load = load
+        self.types = Categories()
+        self.users = Categories()
+        self.datasets = Categories()
+        # Arrays may have spare capacity; only the first `size` rows are valid
+        self._columns: Dict[str, np.ndarray] = {
+            name: np.empty(0, dtype=dtype) for name, dtype in self.COLUMNS.items()
+        }
+        self.size = 0
+        self._stamp: Optional[Stamp] = None
+        # Appends can come from the activity writer's thread
+        self._lock = threading.Lock()
+        # The same protocol as CollectionIndex.lock: held around ensure() and
+        # by writers from replacing the file until committed()
+        self.lock = threading.RLock()
+
+    def ensure(self) -> "ActivityColumns":
+        with self.lock:
+            stamp = file_stamp(self.file_path)
+            if self._stamp is None or stamp != self._stamp:
+                if not (self._stamp is None and self._open_saved(stamp)):
+                    self.rebuild(self._load(self.file_path), stamp)
+                    self._save()
+        return self
+
+    def invalidate(self):
+        with self.lock:
+            self._stamp = None
+
+    def rebuild(self, rows: List[Dict[str, Any]], stamp: Optional[Stamp]):
+        with self._lock:
+            self.types, self.users, self.datasets = Categories(), Categories(), Categories()
+            self._columns = self._encode(rows)
+            self.size = len(rows)
+            self._stamp = stamp
+
+    def committed(self, changed: Iterable[Dict[str, Any]], old_stamp: Optional[Stamp], new_stamp: Optional[Stamp]):
+        # Activities are only ever appended, so the changed rows are new rows
+        with self.lock:
+            if self._stamp is None or self._stamp != old_stamp:
+                return
+            changed = list(changed)
+            with self._lock:
+                encoded = self._encode(changed)
+                needed = self.size + len(changed)
+                for name, column in self._columns.items():
+                    if needed > len(column) or not column.flags.writeable:
+                        # Memory-mapped columns are read-only; the first append
+                        # copies them into memory with room to grow
+                        grown = np.empty(max(needed, 2 * len(column), 1024), dtype=column.dtype)
+                        grown[:self.size] = column[:self.size]
+                        column = self._columns[name] = grown
+                    column[self.size:needed] = encoded[name]
+                self.size = needed
+                self._stamp = new_stamp
+
+    def _encode(self, rows: Sequence[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+        return {
+            # str() gives the same ISO form for datetimes and stored strings
+            "timestamp": np.array([str(row["timestamp"]) for row in rows], dtype="datetime64[us]").astype("datetime64[s]"),
+            "type": self.types.encode(row["type"] for row in rows),
+            "user": self.users.encode(row.get("user_id") for row in rows),
+            "dataset": self.datasets.encode(row.get("dataset_id") for row in rows),
+        }
+
+    def _save(self):
+        # A cache of the JSON file: failing to save only costs a rebuild later
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            for name, column in self._columns.items():
+                self._replace(f"{name}.npy", lambda f, column=column: np.save(f, column[:self.size]))
+            meta = {
+                "stamp": self._stamp,
+                "size": self.size,
+                "types": self.types.values,
+                "users": self.users.values,
+                "datasets": self.datasets.values,
+            }
+            # Written last, so a stamp in meta.json means the columns are complete
+            self._replace("meta.json", lambda f: f.write(json.dumps(meta).encode()))
+        except OSError:
+            pass
+
+    def _replace(self, name: str, write: Callable[[BinaryIO], Any]):
+        # Write a new file and rename it over the old one: this process or a
+        # sibling worker may still memory-map the old .npy, and truncating a
+        # mapped file in place turns reads of it into SIGBUS
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(tmp_path, os.path.join(self.directory, name))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def _open_saved(self, stamp: Optional[Stamp]) -> bool:
+        try:
+            with open(os.path.join(self.directory, "meta.json"), "r") as f:
+                meta = json.load(f)
+            if stamp is None or meta["stamp"] != list(stamp):
+                return False
+            columns = {
+                name: np.load(os.path.join(self.directory, f"{name}.npy"), mmap_mode="r")
+                for name in self.COLUMNS
+            }
+        except (OSError, ValueError, KeyError):
+            return False
+        if any(len(column) != meta["size"] for column in columns.values()):
+            return False
+        with self._lock:
+            self.types = Categories(meta["types"])
+            self.users = Categories(meta["users"])
+            self.datasets = Categories(meta["datasets"])
+            self._columns = columns
+            self.size = meta["size"]
+            self._stamp = stamp
+        return True
+
+    def _view(self) -> Dict[str, np.ndarray]:
+        # Rows appended later land beyond size (or in a new array), so these
+        # views stay consistent for the duration of a query
+        with self._lock:
+            return {name: column[:self.size] for name, column in self._columns.items()}
+
+    def mask(
+        self,
+        columns: Dict[str, np.ndarray],
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        types: Optional[List[str]] = None,
+        dataset_id: Optional[str] = None,
+        user_id: Optional[str] = None
+    ) -> np.ndarray:
+        mask = np.ones(len(columns["timestamp"]), dtype=bool)
+        if start is not None:
+            mask &= columns["timestamp"] >= as_datetime64(start)
+        if end is not None:
+            mask &= columns["timestamp"] < as_datetime64(end)
+        if types:
+            codes = [self.types.codes[t] for t in types if t in self.types.codes]
+            mask &= np.isin(columns["type"], codes)
+        for column, categories, value in (("dataset", self.datasets, dataset_id), ("user", self.users, user_id)):
+            if value is not None:
+                mask &= columns[column] == categories.codes.get(value, -2)
+        return mask
+
+    def aggregate(self, group_by: str, limit: Optional[int] = None, **filters) -> Tuple[int, List[Tuple[Optional[str], int]]]:
+        """Count the matching activities and group them.
+
+        Categorical groups come most frequent first, time groups in
+        chronological order (keys are the ISO start of each bucket).
+        """
+        columns = self._view()
+        mask = self.mask(columns, **filters)
+        total = int(np.count_nonzero(mask))
+
+        if group_by in ("type", "dataset", "user"):
+            categories = {"type": self.types, "dataset": self.datasets, "user": self.users}[group_by]
+            # Shift by one so code -1 (absent) gets bin 0
+            counts = np.bincount(columns[group_by][mask] + 1, minlength=len(categories.values) + 1)
+            present = np.flatnonzero(counts)
+            order = present[np.argsort(-counts[present], kind="stable")]
+            if limit is not None:
+                order = order[:limit]
+            return total, [
+                (categories.values[code - 1] if code else None, int(counts[code]))
+                for code in order
+            ]
+
+        timestamps = columns["timestamp"][mask]
+        if group_by == "week":
+            # Monday-based weeks: 1970-01-01 (day 0) was a Thursday
+            days = timestamps.astype("datetime64[D]").view(np.int64)
+            buckets = (days - (days + 3) % 7).astype("datetime64[D]")
+        else:
+            buckets = timestamps.astype(f"datetime64[{TIME_UNITS[group_by]}]")
+        keys, counts = np.unique(buckets, return_counts=True)
+        if limit is not None:
+            # The latest buckets; not keys[-limit:], which is everything for 0
+            first = max(len(keys) - limit, 0)
+            keys, counts = keys[first:], counts[first:]
+        return total, [(str(key), int(count)) for key, count in zip(keys, counts)]
+
+def as_datetime64(value: datetime) -> np.datetime64:
+    # Stored timestamps are naive UTC
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return np.datetime64(value, "s")
@@ -0,0 +1,249 @@
+"""Synthetic data generator for benchmarks.
+
+Writes users, datasets, access requests and activities at arbitrary scale
+into a database directory, using skewed (Zipf-like) popularity so a few
+datasets and users dominate requests and activity, as in the real catalog.
+
+    python -m benchmarks.datagen --users 10000 --datasets 5000 \\
+        --requests 50000 --activities 200000 --db-dir /tmp/bench-db
+
+Timestamps are spread over the two years before --epoch, which defaults to
+the start of the current UTC day; the same --seed, sizes and epoch give the
+same files byte for byte.
+"""
+from typing import Optional
+from datetime import datetime, timedelta
+import argparse
+import bisect
+import itertools
+import json
+import os
+import random
+import uuid
+
+from passlib.hash import bcrypt
+
+PASSWORD = "password123"
+BCRYPT_SALT_CHARS = "./ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789"
+
+DATA_TYPES = [("mixed", 30), ("imaging", 25), ("questionnaire", 20), ("clinical", 15), ("genetic", 6), ("physiological", 4)]
+ACCESS_TYPES = [("restricted", 50), ("controlled", 30), ("collaboration", 20)]
+COLLABORATION_TYPES = [("academic", 60), ("clinical", 20), ("government", 8), ("nonprofit", 7), ("industry", 5)]
+REQUEST_STATUSES = [("approved", 55), ("pending", 30), ("denied", 15)]
+ACTIVITY_TYPES = [
+    ("access_requested", 40), ("access_granted", 20), ("access_denied", 6),
+    ("dataset_updated", 14), ("user_registered", 12), ("dataset_uploaded", 8),
+]
+
+CONDITIONS = [
+    "depression", "bipolar disorder", "schizophrenia", "anxiety", "autism", "PTSD", "ADHD",
+    "OCD", "psychosis", "eating disorders", "insomnia", "dementia", "substance use", "suicidality",
+]
+MODALITIES = [
+    "neuroimaging", "MRI", "fMRI", "EEG", "questionnaires", "clinical assessment", "genomics",
+    "actigraphy", "voice analysis", "longitudinal", "cognitive assessment", "biomarkers",
+]
+NAME_TEMPLATES = [
+    "{condition} {modality} Study", "Multimodal {condition} Cohort", "{condition} {modality} Repository",
+    "Longitudinal {condition} Registry", "{modality} Markers of {condition}", "{condition} Treatment Response Dataset",
+]
+INSTITUTION_KINDS = ["University", "Medical Center", "Research Institute", "Hospital", "Mental Health Consortium"]
+PLACES = [
+    "Northfield", "Riverside", "Lakeview", "Westbrook", "Highland", "Eastport", "Stonebridge",
+    "Maplewood", "Cedar Hill", "Brookhaven", "Fairmont", "Ashford", "Kingsley", "Oakridge",
+]
+FIRST_NAMES = ["Anna", "Ben", "Chloe", "David", "Elena", "Farid", "Grace", "Hugo", "Ines", "Jonas", "Kira", "Liam", "Maya", "Noah", "Olga", "Pablo"]
+LAST_NAMES = ["Smith", "Chen", "Garcia", "Nguyen", "Müller", "Rossi", "Kowalski", "Okafor", "Haddad", "Silva", "Tanaka", "Dubois", "Novak", "Larsen"]
+
+class WeightedChoice:
+    """Constant-time-ish sampling from a fixed weighted population."""
+
+    def __init__(self, population, weights):
+        self.population = list(population)
+        self.cumulative = list(itertools.accumulate(weights))
+        self.total = self.cumulative[-1]
+
+    def __call__(self, rng: random.Random):
+        return self.population[bisect.bisect_right(self.cumulative, rng.random() * self.total)]
+
+def categorical(pairs):
+    return WeightedChoice([value for value, _ in pairs], [weight for _, weight in pairs])
+
+def zipf(population, exponent: float = 1.1):
+    """Popularity by rank: item i is chosen with weight 1 / (i + 1) ** exponent."""
+    return WeightedChoice(population, [1.0 / (rank + 1) ** exponent for rank in range(len(population))])
+
+def recent_timestamp(rng: random.Random, now: datetime, days: int = 730) -> datetime:
+    # Skewed towards the present: activity grows over time
+    return now - timedelta(seconds=days * 86400 * rng.random() ** 2)
+
+def sample_size_text(rng: random.Random) -> str:
+    n = int(rng.lognormvariate(6, 1)) + 20
+    style = rng.random()
+    if style < 0.5:
+        return f"{n} participants"
+    if style < 0.7:
+        return f"{n:,} participants"
+    if style < 0.9:
+        return f"{n // 2} patients, {n - n // 2} controls"
+    return str(n)
+
+def default_epoch() -> datetime:
+    return datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+
+def password_hash(seed: int) -> str:
+    # bcrypt with a salt drawn from the seed, so the hash is reproducible;
+    # the last of the 22 salt characters only carries 2 bits
+    rng = random.Random(f"salt-{seed}")
+    salt = "".join(rng.choice(BCRYPT_SALT_CHARS) for _ in range(21)) + rng.choice(".Oeu")
+    return bcrypt.using(salt=salt).hash(PASSWORD)
+
+def generate(users: int, datasets: int, requests: int, activities: int, seed: int = 42, epoch: Optional[datetime] = None):
+    rng = random.Random(seed)
+    # Generated timestamps lead up to this moment
+    now = epoch or default_epoch()
+    # One bcrypt hash shared by every account: hashing N passwords would
+    # dominate generation time and every user logs in with PASSWORD anyway
+    hashed_password = password_hash(seed)
+
+    institutions = [f"{place} {kind}" for place in PLACES for kind in INSTITUTION_KINDS]
+    rng.shuffle(institutions)
+    pick_institution = zipf(institutions, 0.8)
+    pick_data_type = categorical(DATA_TYPES)
+    pick_access_type = categorical(ACCESS_TYPES)
+    pick_collaboration = categorical(COLLABORATION_TYPES)
+    pick_status = categorical(REQUEST_STATUSES)
+    pick_activity = categorical(ACTIVITY_TYPES)
+
+    user_rows = []
+    for i in range(users):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        username = "admin@example.com" if i == 0 else f"{first.lower()}.{last.lower()}.{i}@example.org"
+        user_rows.append({
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "username": username,
+            "email": username,
+            "full_name": "Admin User" if i == 0 else f"{first} {last}",
+            "institution": pick_institution(rng),
+            "hashed_password": hashed_password,
+            "is_admin": i == 0,
+            "is_active": rng.random() > 0.02 or i == 0,
+            "created_at": recent_timestamp(rng, now).isoformat(),
+            "avatar_url": f"https://api.dicebear.com/7.x/avataaars/svg?seed={i}",
+        })
+
+    dataset_rows = []
+    for i in range(datasets):
+        condition, modality = rng.choice(CONDITIONS), rng.choice(MODALITIES)
+        start_year = rng.randint(2000, 2022)
+        created_at = recent_timestamp(rng, now)
+        keywords = {condition, modality} | set(rng.sample(CONDITIONS + MODALITIES, rng.randint(1, 4)))
+        dataset_rows.append({
+            "id": f"ds-{i + 1:06d}",
+            "name": rng.choice(NAME_TEMPLATES).format(condition=condition.title(), modality=modality),
+            "description": (
+                f"Data on {condition} collected with {modality} across "
+                f"{rng.randint(1, 12)} sites, including {', '.join(rng.sample(MODALITIES, 3))}."
+            ),
+            "institution": pick_institution(rng),
+            "data_type": pick_data_type(rng),
+            "access_type": pick_access_type(rng),
+            "collaboration_type": pick_collaboration(rng),
+            "contact_email": f"data{i}@example.org",
+            "sample_size": sample_size_text(rng),
+            "year_collected": f"{start_year}-{min(start_year + rng.randint(0, 6), now.year)}",
+            "keywords": ", ".join(sorted(keywords)),
+            "requires_ethics_approval": rng.random() < 0.85,
+            "has_publications": rng.random() < 0.4,
+            "owner_id": user_rows[0]["id"],
+            "created_at": created_at.isoformat(),
+            "updated_at": (created_at + (now - created_at) * rng.random()).isoformat(),
+            "image_url": "https://images.unsplash.com/photo-1559757175-7cb036e0d465?w=400&q=80",
+            "is_available": rng.random() < 0.95,
+            "access_count": 0,
+        })
+
+    pick_dataset = zipf(dataset_rows)
+    pick_user = zipf(user_rows[1:] or user_rows, 0.7)
+
+    request_rows = []
+    for i in range(requests):
+        dataset, user = pick_dataset(rng), pick_user(rng)
+        created_at = recent_timestamp(rng, now)
+        status = pick_status(rng)
+        decided_at = created_at + timedelta(hours=rng.uniform(1, 240))
+        if status == "approved":
+            dataset["access_count"] += 1
+        request_rows.append({
+            "id": f"req-{i + 1:07d}",
+            "dataset_id": dataset["id"],
+            "user_id": user["id"],
+            "purpose": f"Secondary analysis of {rng.choice(CONDITIONS)} outcomes",
+            "project_description": "Synthetic access request generated for benchmarking.",
+            "agree_to_dua": True,
+            "agree_to_terms": True,
+            "status": status,
+            "created_at": created_at.isoformat(),
+            "updated_at": (decided_at if status != "pending" else created_at).isoformat(),
+            "approved_at": decided_at.isoformat() if status == "approved" else None,
+            "denied_at": decided_at.isoformat() if status == "denied" else None,
+            "expiry_date": (decided_at + timedelta(days=365)).isoformat() if status == "approved" else None,
+        })
+
+    activity_rows = []
+    for i in range(activities):
+        activity_type = pick_activity(rng)
+        dataset, user = pick_dataset(rng), pick_user(rng)
+        admin = user_rows[0]
+        row = {
+            "id": str(i + 1),
+            "type": activity_type,
+            "description": f"Synthetic {activity_type.replace('_', ' ')} event",
+            "user_id": user["id"],
+            "target_id": None,
+            "dataset_id": dataset["id"],
+            "timestamp": recent_timestamp(rng, now).isoformat(),
+        }
+        if activity_type == "user_registered":
+            row.update(user_id=None, target_id=user["id"], dataset_id=None)
+        elif activity_type in ("access_granted", "access_denied"):
+            row.update(user_id=admin["id"], target_id=user["id"])
+        elif activity_type in ("dataset_uploaded", "dataset_updated"):
+            row.update(user_id=admin["id"])
+        activity_rows.append(row)
+    activity_rows.sort(key=lambda row: row["timestamp"])
+
+    return {
+        "users": user_rows,
+        "datasets": dataset_rows,
+        "access_requests": request_rows,
+        "activities": activity_rows,
+    }
+
+def write_database(data, db_dir: str):
+    os.makedirs(db_dir, exist_ok=True)
+    for collection, rows in data.items():
+        with open(os.path.join(db_dir, f"{collection}.json"), "w") as f:
+            json.dump(rows, f, default=str)
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic database for benchmarks")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--datasets", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--activities", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--epoch", type=datetime.fromisoformat, default=None, help="latest timestamp, ISO format in UTC (default: start of today)")
+    parser.add_argument("--db-dir", default=os.getenv("DB_DIR", "db"))
+    args = parser.parse_args()
+
+    data = generate(args.users, args.datasets, args.requests, args.activities, seed=args.seed, epoch=args.epoch)
+    write_database(data, args.db_dir)
+    print(
+        f"Wrote {len(data['users'])} users, {len(data['datasets'])} datasets, "
+        f"{len(data['access_requests'])} access requests and {len(data['activities'])} activities to {args.db_dir}"
+    )
+    print(f"Admin user: {data['users'][0]['username']} / {PASSWORD}")
+
+if __name__ == "__main__":
+    main()
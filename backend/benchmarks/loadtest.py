@@ -0,0 +1,309 @@
+"""HTTP load harness for the API.
+
+Generates a synthetic database (see datagen.py), then drives the app with a
+weighted mix of catalog browsing, search, dataset views, logins, access
+request submission and admin approvals, and reports throughput and
+p50/p95/p99 latency per operation.
+
+    # In-process through the ASGI app (no network, single client)
+    python -m benchmarks.loadtest --mode inprocess --duration 30
+
+    # Against a local uvicorn started by the harness
+    python -m benchmarks.loadtest --mode http --concurrency 16 --duration 30
+
+Run from the backend directory. The same --seed, data sizes and --epoch
+give the same database, and each worker draws the same sequence of
+operations. With several workers the run is still not exactly repeatable:
+they approve requests from one shared pool of pending requests, so which
+request a worker approves, and when the pool runs dry, depends on timing.
+"""
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime
+from urllib.parse import urlencode
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks import datagen
+
+DEFAULT_MIX = "browse=30,search=25,view=25,login=5,request=10,approve=5"
+SEARCH_TERMS = ["depression", "MRI", "schizophrenia", "longitudinal", "anxiety", "EEG", "autism", "genomics"]
+
+def parse_mix(text: str) -> List[Tuple[str, float]]:
+    mix = []
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in OPERATIONS:
+            raise SystemExit(f"Unknown operation {name!r}, expected one of: {', '.join(OPERATIONS)}")
+        mix.append((name, float(weight)))
+    return mix
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+# Clients: both expose request(method, path, headers, form=None, json_body=None) -> (status, body)
+class InProcessClient:
+    def __init__(self, app):
+        from fastapi.testclient import TestClient
+        self._client = TestClient(app)
+        self._client.__enter__()
+
+    def request(self, method, path, headers=None, form=None, json_body=None):
+        response = self._client.request(method, path, headers=headers, data=form, json=json_body)
+        return response.status_code, response.content
+
+    def close(self):
+        self._client.__exit__(None, None, None)
+
+class HttpClient:
+    def __init__(self, host: str, port: int):
+        self._connection = http.client.HTTPConnection(host, port, timeout=60)
+
+    def request(self, method, path, headers=None, form=None, json_body=None):
+        headers = dict(headers or {})
+        body = None
+        if form is not None:
+            body = urlencode(form)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        elif json_body is not None:
+            body = json.dumps(json_body)
+            headers["Content-Type"] = "application/json"
+        self._connection.request(method, path, body=body, headers=headers)
+        response = self._connection.getresponse()
+        return response.status, response.read()
+
+    def close(self):
+        self._connection.close()
+
+class Workload:
+    """Shared state for one run: ids to pick from and logged-in tokens."""
+
+    def __init__(self, data, rng: random.Random, login_users: int):
+        self.dataset_ids = [d["id"] for d in data["datasets"]]
+        self.usernames = [u["username"] for u in data["users"][1:] if u["is_active"]] or [data["users"][0]["username"]]
+        self.admin = data["users"][0]["username"]
+        self.pick_dataset = datagen.zipf(self.dataset_ids)
+        self.pending = [r["id"] for r in data["access_requests"] if r["status"] == "pending"]
+        self.lock = threading.Lock()
+        self.tokens: List[str] = []
+        self.admin_token: Optional[str] = None
+        self.login_pool = rng.sample(self.usernames, min(login_users, len(self.usernames)))
+
+    def login(self, client, username) -> str:
+        status, body = client.request("POST", "/token", form={"username": username, "password": datagen.PASSWORD})
+        if status != 200:
+            raise RuntimeError(f"Login failed for {username}: {status} {body[:200]!r}")
+        return json.loads(body)["access_token"]
+
+    def prepare(self, client):
+        self.admin_token = self.login(client, self.admin)
+        self.tokens = [self.login(client, username) for username in self.login_pool]
+
+    def take_pending(self) -> Optional[str]:
+        with self.lock:
+            return self.pending.pop() if self.pending else None
+
+    def add_pending(self, request_id: str):
+        with self.lock:
+            self.pending.append(request_id)
+
+def auth(token: str) -> Dict[str, str]:
+    return {"Authorization": f"Bearer {token}"}
+
+# Operations: (client, workload, rng) -> (status, body)
+def op_browse(client, workload, rng):
+    skip = rng.randrange(0, max(1, len(workload.dataset_ids) - 20))
+    return client.request("GET", f"/datasets/?skip={skip}&limit=20")
+
+def op_search(client, workload, rng):
+    return client.request("GET", f"/datasets/?search={rng.choice(SEARCH_TERMS)}&limit=20")
+
+def op_view(client, workload, rng):
+    return client.request("GET", f"/datasets/{workload.pick_dataset(rng)}")
+
+def op_login(client, workload, rng):
+    return client.request("POST", "/token", form={"username": rng.choice(workload.login_pool), "password": datagen.PASSWORD})
+
+def op_request(client, workload, rng):
+    status, body = client.request("POST", "/access-requests/", headers=auth(rng.choice(workload.tokens)), json_body={
+        "dataset_id": workload.pick_dataset(rng),
+        "purpose": "Benchmark access request",
+        "project_description": "Submitted by the load harness.",
+        "agree_to_dua": True,
+        "agree_to_terms": True,
+    })
+    if status == 200:
+        workload.add_pending(json.loads(body)["id"])
+    return status, body
+
+def op_approve(client, workload, rng):
+    request_id = workload.take_pending()
+    if request_id is None:
+        return op_view(client, workload, rng)
+    return client.request("PUT", f"/access-requests/{request_id}/approve", headers=auth(workload.admin_token))
+
+OPERATIONS = {
+    "browse": op_browse,
+    "search": op_search,
+    "view": op_view,
+    "login": op_login,
+    "request": op_request,
+    "approve": op_approve,
+}
+
+class Results:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = {}
+        self.client_errors: Dict[str, int] = {}
+        self.server_errors: Dict[str, int] = {}
+
+    def record(self, operation: str, elapsed: float, status: int):
+        with self.lock:
+            self.latencies.setdefault(operation, []).append(elapsed)
+            if 400 <= status < 500:
+                self.client_errors[operation] = self.client_errors.get(operation, 0) + 1
+            elif status >= 500:
+                self.server_errors[operation] = self.server_errors.get(operation, 0) + 1
+
+    def summary(self, wall_time: float):
+        rows = []
+        for operation in sorted(self.latencies):
+            values = sorted(self.latencies[operation])
+            rows.append({
+                "operation": operation,
+                "count": len(values),
+                "throughput": len(values) / wall_time,
+                "p50_ms": percentile(values, 0.50) * 1000,
+                "p95_ms": percentile(values, 0.95) * 1000,
+                "p99_ms": percentile(values, 0.99) * 1000,
+                "4xx": self.client_errors.get(operation, 0),
+                "5xx": self.server_errors.get(operation, 0),
+            })
+        total = sum(row["count"] for row in rows)
+        return {"wall_time": wall_time, "total": total, "throughput": total / wall_time, "operations": rows}
+
+def run_worker(client, workload, mix, results, deadline, max_ops, seed):
+    rng = random.Random(seed)
+    choose = datagen.WeightedChoice([name for name, _ in mix], [weight for _, weight in mix])
+    done = 0
+    while time.perf_counter() < deadline and (max_ops is None or done < max_ops):
+        operation = choose(rng)
+        start = time.perf_counter()
+        try:
+            status, _ = OPERATIONS[operation](client, workload, rng)
+        except (OSError, http.client.HTTPException):
+            status = 599
+        results.record(operation, time.perf_counter() - start, status)
+        done += 1
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def wait_for_server(port: int, timeout: float = 30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            connection.request("GET", "/health")
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError("uvicorn did not start")
+
+def print_summary(summary):
+    print(f"\n{'operation':<10} {'count':>8} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'4xx':>6} {'5xx':>6}")
+    for row in summary["operations"]:
+        print(
+            f"{row['operation']:<10} {row['count']:>8} {row['throughput']:>9.1f} {row['p50_ms']:>9.2f} "
+            f"{row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f} {row['4xx']:>6} {row['5xx']:>6}"
+        )
+    print(f"{'total':<10} {summary['total']:>8} {summary['throughput']:>9.1f}   ({summary['wall_time']:.1f}s)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the API with a synthetic workload")
+    parser.add_argument("--mode", choices=("inprocess", "http"), default="inprocess")
+    parser.add_argument("--duration", type=float, default=20, help="seconds to run")
+    parser.add_argument("--operations", type=int, default=None, help="stop each worker after this many operations")
+    parser.add_argument("--concurrency", type=int, default=8, help="client threads (http mode)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="comma-separated operation=weight pairs")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--datasets", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--activities", type=int, default=20000)
+    parser.add_argument("--login-users", type=int, default=20, help="distinct accounts that log in and submit requests")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--epoch", type=datetime.fromisoformat, default=None, help="latest generated timestamp, ISO format in UTC (default: start of today)")
+    parser.add_argument("--db-dir", default=None, help="database directory (default: a fresh temporary directory)")
+    parser.add_argument("--uvicorn-args", default="", help="extra arguments for uvicorn in http mode")
+    parser.add_argument("--json", dest="json_path", default=None, help="also write the summary as JSON to this path")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    db_dir = args.db_dir or tempfile.mkdtemp(prefix="loadtest-db-")
+    data = datagen.generate(args.users, args.datasets, args.requests, args.activities, seed=args.seed, epoch=args.epoch)
+    datagen.write_database(data, db_dir)
+    os.environ["DB_DIR"] = db_dir
+    print(f"Database: {db_dir} ({args.users} users, {args.datasets} datasets, {args.requests} requests, {args.activities} activities)")
+
+    rng = random.Random(args.seed)
+    workload = Workload(data, rng, args.login_users)
+    results = Results()
+    server = None
+
+    if args.mode == "inprocess":
+        import main as api
+        clients = [InProcessClient(api.app)]
+    else:
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"]
+            + args.uvicorn_args.split(),
+            env=dict(os.environ),
+        )
+        wait_for_server(port)
+        clients = [HttpClient("127.0.0.1", port) for _ in range(args.concurrency)]
+
+    try:
+        workload.prepare(clients[0])
+        start = time.perf_counter()
+        deadline = start + args.duration
+        threads = [
+            threading.Thread(target=run_worker, args=(client, workload, mix, results, deadline, args.operations, args.seed + i))
+            for i, client in enumerate(clients)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        summary = results.summary(time.perf_counter() - start)
+    finally:
+        for client in clients:
+            client.close()
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    summary.update(mode=args.mode, concurrency=len(clients), mix=args.mix, seed=args.seed)
+    print_summary(summary)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(summary, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Memory footprint of the in-memory record representations.
+
+Generates synthetic activities and access requests (see datagen.py), then
+measures with tracemalloc what holding them in memory costs as parsed JSON
+dicts, as the compact records in records.py, and as pydantic models.
+
+    python -m benchmarks.memory --activities 1000000 --requests 100000
+
+Run from the backend directory. The pydantic measurement is the slowest;
+--skip-models leaves it out.
+"""
+from typing import Callable, Dict, List
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+
+from benchmarks import datagen
+from models import AccessRequest, Activity
+from records import AccessRequestRecord, ActivityRecord
+
+COLLECTIONS = {
+    "activities": (ActivityRecord, Activity),
+    "access_requests": (AccessRequestRecord, AccessRequest),
+}
+
+def measure(raw: str, build: Callable[[List[Dict]], List]) -> Dict[str, float]:
+    # Allocations still held once the collection is built; the raw JSON text
+    # is allocated before tracing starts and is not counted
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    rows = build(json.loads(raw))
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result = {"rows": len(rows), "bytes": current, "peak_bytes": peak, "seconds": elapsed}
+    del rows
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare memory use of record representations")
+    parser.add_argument("--activities", type=int, default=1000000)
+    parser.add_argument("--requests", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skip-models", action="store_true", help="don't measure pydantic models")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    data = datagen.generate(users=1000, datasets=500, requests=args.requests, activities=args.activities, seed=args.seed)
+    results = {}
+    for collection, (record_type, model) in COLLECTIONS.items():
+        raw = json.dumps(data.pop(collection))
+        representations = {
+            "dicts": lambda rows: rows,
+            "records": lambda rows: [record_type(row) for row in rows],
+        }
+        if not args.skip_models:
+            representations["models"] = lambda rows: [model(**row) for row in rows]
+
+        results[collection] = {}
+        for name, build in representations.items():
+            result = measure(raw, build)
+            results[collection][name] = result
+            print(
+                f"{collection:16} {name:8} {result['rows']:>9} rows  "
+                f"{result['bytes'] / 2**20:9.1f} MiB  {result['bytes'] / max(result['rows'], 1):7.0f} B/row  "
+                f"peak {result['peak_bytes'] / 2**20:9.1f} MiB  {result['seconds']:6.2f}s"
+            )
+        del raw
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import argparse
+import csv
+import io
+import json
+import multiprocessing
+import os
+import sys
+import uuid
+
+from pydantic import ValidationError
+from passlib.context import CryptContext
+from models import DatasetCreate, DatasetInDB, UserCreate, UserInDB
+
+# Bulk import of datasets and user accounts from CSV or NDJSON.
+# Rows are streamed from the input, validated against DatasetCreate/UserCreate
+# in a process pool (where user passwords are also hashed, so bcrypt runs on
+# every core), and the valid rows are committed with one write per collection
+# instead of one full-file rewrite per record.
+
+IMPORT_KINDS = ("datasets", "users")
+IMPORT_FORMATS = ("csv", "ndjson")
+
+# Rows per task sent to a worker; bcrypt dominates user rows, so those go in
+# small chunks to keep every core busy
+CHUNK_SIZES = {"datasets": 500, "users": 8}
+
+# Reported per import; the rest are summarised by the count
+MAX_REPORTED_ERRORS = 100
+
+_pwd_context = None
+
+def _hash_password(password: str) -> str:
+    global _pwd_context
+    if _pwd_context is None:
+        _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return _pwd_context.hash(password)
+
+def hash_passwords(passwords: List[str], workers: Optional[int] = None) -> List[str]:
+    with _process_pool(workers) as pool:
+        return list(pool.map(_hash_password, passwords))
+
+def _process_pool(workers: Optional[int]) -> ProcessPoolExecutor:
+    # spawn rather than fork: the server process has threads and an event loop
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+def detect_format(filename: Optional[str]) -> str:
+    if filename and filename.lower().endswith(".csv"):
+        return "csv"
+    return "ndjson"
+
+def iter_rows(stream: io.TextIOBase, fmt: str) -> Iterator[Tuple[int, Any]]:
+    """Yield (line number, row) pairs; undecodable NDJSON lines yield the error text."""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            # Empty CSV cells mean "not provided"
+            yield reader.line_num, {key: value for key, value in row.items() if key and value != ""}
+        return
+
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_number, f"Invalid JSON: {e}"
+
+def _chunks(rows: Iterable[Tuple[int, Any]], size: int) -> Iterator[List[Tuple[int, Any]]]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def validate_chunk(kind: str, rows: List[Tuple[int, Any]]) -> List[Tuple[int, Optional[Dict[str, Any]], Optional[str]]]:
+    """Runs in a worker process: returns (line, validated fields, error) per row."""
+    model = DatasetCreate if kind == "datasets" else UserCreate
+    results = []
+    for line_number, row in rows:
+        if not isinstance(row, dict):
+            results.append((line_number, None, row if isinstance(row, str) else "Expected an object"))
+            continue
+        try:
+            validated = model(**row).dict()
+        except ValidationError as e:
+            errors = "; ".join(f"{'.'.join(str(loc) for loc in error['loc'])}: {error['msg']}" for error in e.errors())
+            results.append((line_number, None, errors))
+            continue
+        if kind == "users":
+            validated["hashed_password"] = _hash_password(validated.pop("password"))
+        results.append((line_number, validated, None))
+    return results
+
+def validate_rows(kind: str, rows: Iterable[Tuple[int, Any]], workers: Optional[int] = None):
+    """Validate rows in parallel, yielding results in input order."""
+    workers = workers or os.cpu_count() or 1
+    with _process_pool(workers) as pool:
+        pending = []
+        for chunk in _chunks(rows, CHUNK_SIZES[kind]):
+            pending.append(pool.submit(validate_chunk, kind, chunk))
+            # Bound the number of chunks held in memory
+            while len(pending) > 4 * workers:
+                yield from pending.pop(0).result()
+        for future in pending:
+            yield from future.result()
+
+class ImportResult:
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.rows = 0
+        self.records: List[Any] = []
+        self.errors: List[Dict[str, Any]] = []
+        self.error_count = 0
+
+    def add_error(self, line_number: int, error: str):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line_number, "error": error})
+
+    def summary(self, committed: bool) -> Dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "rows": self.rows,
+            "valid": len(self.records),
+            "invalid": self.error_count,
+            "imported": len(self.records) if committed else 0,
+            "errors": self.errors,
+        }
+
+def prepare_import(
+    kind: str,
+    rows: Iterable[Tuple[int, Any]],
+    owner_id: Optional[str] = None,
+    existing_usernames: Set[str] = frozenset(),
+    existing_emails: Set[str] = frozenset(),
+    workers: Optional[int] = None,
+) -> ImportResult:
+    result = ImportResult(kind)
+    usernames, emails = set(existing_usernames), set(existing_emails)
+    now = datetime.utcnow()
+
+    for line_number, fields, error in validate_rows(kind, rows, workers):
+        result.rows += 1
+        if error is not None:
+            result.add_error(line_number, error)
+            continue
+
+        if kind == "users":
+            if fields["username"] in usernames:
+                result.add_error(line_number, "Username already registered")
+                continue
+            if fields["email"] in emails:
+                result.add_error(line_number, "Email already registered")
+                continue
+            usernames.add(fields["username"])
+            emails.add(fields["email"])
+            result.records.append(UserInDB(
+                id=str(uuid.uuid4()),
+                is_admin=False,
+                is_active=True,
+                created_at=now,
+                avatar_url=f"https://api.dicebear.com/7.x/avataaars/svg?seed={fields['username']}",
+                **fields
+            ))
+        else:
+            result.records.append(DatasetInDB(
+                id=str(uuid.uuid4()),
+                owner_id=owner_id,
+                created_at=now,
+                updated_at=now,
+                image_url=f"https://images.unsplash.com/photo-{1550000000 + int(uuid.uuid4().int % 9999999)}?w=400&q=80",
+                is_available=True,
+                access_count=0,
+                **fields
+            ))
+
+    return result
+
+def run_import(
+    kind: str,
+    stream: io.TextIOBase,
+    fmt: str,
+    owner=None,
+    skip_invalid: bool = False,
+    dry_run: bool = False,
+    workers: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Validate and commit an import; nothing is written if any row is invalid unless skip_invalid."""
+    from database import get_user_keys, import_datasets, import_users
+
+    usernames, emails = get_user_keys() if kind == "users" else (set(), set())
+    result = prepare_import(
+        kind,
+        iter_rows(stream, fmt),
+        owner_id=owner.id if owner is not None else None,
+        existing_usernames=usernames,
+        existing_emails=emails,
+        workers=workers,
+    )
+
+    commit = not dry_run and bool(result.records) and (skip_invalid or result.error_count == 0)
+    if commit:
+        if kind == "users":
+            import_users(result.records)
+        else:
+            import_datasets(result.records, owner)
+    return result.summary(commit)
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import datasets or users from CSV or NDJSON")
+    parser.add_argument("kind", choices=IMPORT_KINDS)
+    parser.add_argument("path", help="input file, or - for stdin")
+    parser.add_argument("--format", choices=IMPORT_FORMATS, default=None, help="default: from the file extension")
+    parser.add_argument("--owner", default="admin@example.com", help="username that will own imported datasets")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--skip-invalid", action="store_true", help="import valid rows even if some rows are invalid")
+    parser.add_argument("--dry-run", action="store_true", help="validate only")
+    args = parser.parse_args()
+
+    from database import get_user
+
+    owner = None
+    if args.kind == "datasets":
+        owner = get_user(username=args.owner)
+        if owner is None:
+            parser.error(f"Unknown owner {args.owner!r}")
+
+    fmt = args.format or detect_format(args.path)
+    stream = sys.stdin if args.path == "-" else open(args.path, newline="", encoding="utf-8")
+    with stream:
+        summary = run_import(args.kind, stream, fmt, owner, args.skip_invalid, args.dry_run, args.workers)
+
+    for error in summary["errors"]:
+        print(f"line {error['line']}: {error['error']}", file=sys.stderr)
+    print(
+        f"{summary['rows']} rows, {summary['valid']} valid, {summary['invalid']} invalid, "
+        f"{summary['imported']} {args.kind} imported"
+    )
+    if summary["invalid"] and not args.skip_invalid:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+from typing import Any, Hashable, Optional
+from collections import OrderedDict
+import threading
+import time
+
+from metrics import QUERY_CACHE_ENTRIES, QUERY_CACHE_LOOKUPS
+
+# Bounded LRU cache of serialized query results.
+# Each entry remembers the generation of the collection it was computed from;
+# a lookup under a newer generation is a miss, so any write to the collection
+# invalidates every cached result at once without tracking which ones it
+# affects. The TTL bounds how stale buffered counters in a response can get.
+
+class QueryCache:
+    def __init__(self, name: str, max_entries: int = 256, ttl: float = 5.0):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        QUERY_CACHE_ENTRIES.set_function(lambda: len(self._entries), name)
+
+    def get(self, key: Hashable, generation: int) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                result, value = "miss", None
+            elif entry[0] != generation or entry[1] <= now:
+                del self._entries[key]
+                result, value = "stale", None
+            else:
+                self._entries.move_to_end(key)
+                result, value = "hit", entry[2]
+        QUERY_CACHE_LOOKUPS.inc(self.name, result)
+        return value
+
+    def put(self, key: Hashable, generation: int, value: Any):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (generation, time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,171 @@
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+from collections import deque
+import asyncio
+import itertools
+import json
+import os
+import tempfile
+import threading
+
+# Change feed for incremental sync.
+# Every record a transaction commits becomes an entry
+#     {"seq": n, "collection": ..., "id": ..., "record": {...}}
+# with seq increasing by one per entry across all collections. Entries are
+# appended to an NDJSON file so the sequence survives restarts, and the most
+# recent `retention` of them are kept in memory to answer /changes. A client
+# whose cursor is older than that has missed changes and must resync.
+
+class ChangesExpired(Exception):
+    """The requested position is older than the retained change log."""
+
+class ChangeLog:
+    def __init__(self, file_path: str, retention: int = 100000):
+        self.file_path = file_path
+        self.retention = retention
+        self._entries: Deque[Dict[str, Any]] = deque()
+        self.last_seq = 0
+        # Lines in the file; it is compacted to `retention` lines at twice that
+        self._lines = 0
+        # How far this process has read or written the file, and which file
+        # that was (compaction replaces it), for sync()
+        self._offset = 0
+        self._inode: Optional[int] = None
+        self._lock = threading.Lock()
+        # Long-poll waiters, woken from whichever thread adds entries
+        self._waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+        self.sync()
+
+    def _read(self) -> List[Dict[str, Any]]:
+        # Complete lines past the offset; a line another process is still
+        # appending is left for the next read
+        with open(self.file_path, "rb") as f:
+            st = os.fstat(f.fileno())
+            reread = st.st_ino != self._inode or st.st_size < self._offset
+            offset = 0 if reread else self._offset
+            f.seek(offset)
+            entries = []
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                offset += len(line)
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # A line torn by a crash mid-append; its transaction
+                    # is still in the journal and is appended again
+                    continue
+        self._inode, self._offset = st.st_ino, offset
+        self._lines = len(entries) if reread else self._lines + len(entries)
+        return entries
+
+    def _add(self, entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        with self._lock:
+            entries = [entry for entry in entries if entry["seq"] > self.last_seq]
+            if not entries:
+                return entries
+            self._entries.extend(entries)
+            while len(self._entries) > self.retention:
+                self._entries.popleft()
+            self.last_seq = entries[-1]["seq"]
+            waiters, self._waiters = self._waiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(wake, future)
+        return entries
+
+    def sync(self) -> Tuple[List[Dict[str, Any]], bool]:
+        """Take in entries other processes appended to the file.
+
+        Returns the new entries, and whether some were missed because the
+        file was compacted before this process read them.
+        """
+        try:
+            entries = self._read()
+        except FileNotFoundError:
+            return [], False
+        last_seq = self.last_seq
+        entries = self._add(entries)
+        return entries, bool(entries) and last_seq > 0 and entries[0]["seq"] > last_seq + 1
+
+    def number(self, changes: Dict[str, Iterable[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        # Entries for the records of one transaction, numbered after the last
+        # appended entry; called under the write lock after sync(), so no one
+        # else numbers
+        seq = itertools.count(self.last_seq + 1)
+        return [
+            {"seq": next(seq), "collection": collection, "id": record["id"], "record": record}
+            for collection, records in changes.items()
+            for record in records
+        ]
+
+    def append(self, entries: List[Dict[str, Any]]):
+        # Called under the write lock, with everything other processes
+        # appended already read by sync()
+        entries = [entry for entry in entries if entry["seq"] > self.last_seq]
+        if not entries:
+            return
+        with open(self.file_path, "ab") as f:
+            f.write("".join(json.dumps(entry, default=str) + "\n" for entry in entries).encode())
+            self._offset = f.tell()
+            self._inode = os.fstat(f.fileno()).st_ino
+        self._lines += len(entries)
+        self._add(entries)
+        if self._lines > 2 * self.retention:
+            self._compact()
+
+    def _compact(self):
+        with self._lock:
+            entries = list(self._entries)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.file_path) or ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write("".join(json.dumps(entry, default=str) + "\n" for entry in entries).encode())
+                self._offset = f.tell()
+                self._inode = os.fstat(f.fileno()).st_ino
+            os.replace(tmp_path, self.file_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self._lines = len(entries)
+
+    def since(self, seq: int, collections: Optional[Iterable[str]] = None, limit: int = 1000) -> Tuple[List[Dict[str, Any]], int]:
+        """Entries after seq, oldest first, and the position to continue from.
+
+        Raises ChangesExpired if entries after seq are no longer retained.
+        """
+        wanted = None if collections is None else set(collections)
+        with self._lock:
+            oldest = self._entries[0]["seq"] if self._entries else self.last_seq + 1
+            if seq < oldest - 1:
+                raise ChangesExpired(f"Changes before {oldest} are no longer available")
+            # seq numbers are contiguous, so the position follows from them
+            start = max(seq + 1 - oldest, 0)
+            entries = []
+            position = max(seq, oldest - 1)
+            for entry in itertools.islice(self._entries, start, None):
+                if len(entries) >= limit:
+                    break
+                position = entry["seq"]
+                if wanted is None or entry["collection"] in wanted:
+                    entries.append(entry)
+        return entries, position
+
+    async def wait(self, seq: int, timeout: float):
+        """Return once an entry after seq exists, or after timeout seconds."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            if self.last_seq > seq:
+                return
+            self._waiters.append((loop, future))
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._lock:
+                if (loop, future) in self._waiters:
+                    self._waiters.remove((loop, future))
+
+def wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
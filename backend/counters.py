@@ -0,0 +1,39 @@
+from typing import Dict
+import threading
+
+# Buffered counters for dataset views and access grants.
+# Incrementing a field in datasets.json directly would rewrite the whole file
+# on every view, so increments are accumulated here and applied to storage in
+# batches (see database.flush_dataset_counters).
+
+class CounterBuffer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Dict[str, int]] = {}
+
+    def __len__(self):
+        return len(self._pending)
+
+    def incr(self, key: str, field: str, amount: int = 1):
+        with self._lock:
+            fields = self._pending.get(key)
+            if fields is None:
+                fields = self._pending[key] = {}
+            fields[field] = fields.get(field, 0) + amount
+
+    def pending(self, key: str) -> Dict[str, int]:
+        # A copy: incr() updates the per-key dicts in place
+        with self._lock:
+            return dict(self._pending.get(key, {}))
+
+    def drain(self) -> Dict[str, Dict[str, int]]:
+        # The buffer is swapped out whole, so nothing is counted twice or lost
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+    def restore(self, pending: Dict[str, Dict[str, int]]):
+        # Put back increments from a flush that failed to reach storage
+        for key, fields in pending.items():
+            for field, amount in fields.items():
+                self.incr(key, field, amount)
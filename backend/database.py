@@ -1,27 +1,59 @@
-from typing import List, Optional, Dict, Any
-from datetime import datetime
+from typing import List, Optional, Dict, Any, Callable, Iterator, Set, Tuple
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timedelta
+import itertools
 import json
 import os
 import random
+import re
+import tempfile
+import threading
+import time
 from models import (
     User, UserInDB, UserUpdate,
     Dataset, DatasetInDB, DatasetUpdate,
     AccessRequest, AccessRequestInDB, AccessRequestUpdate,
-    Activity, ActivityInDB, ActivityCreate,
-    DatasetStats, DatasetMetadata
+    Activity, ActivityInDB, ActivityCreate, ActivityAggregate, ActivityGroup,
+    AccessRequestDecisionOutcome, Entitlement, Change, ChangeFeed,
+    DatasetStats, DatasetMetadata, DatasetDetail
+)
+from counters import CounterBuffer
+from metrics import STORAGE_SECONDS, STORAGE_BYTES
+from trending import EVENT_WEIGHTS, TrendingTracker, to_epoch
+from similarity import SimilarityIndex
+from records import AccessRequestRecord, DatasetRecord, UserRecord
+from activity_store import ACTIVITY_GROUPINGS, ActivityColumns
+from changes import ChangeLog
+from workers import WorkerChannel, WriteLock
+from indexes import (
+    CollectionIndex, DeadlineIndex, HashIndex, PrefixIndex, SortedIndex, SubstringIndex, SuggestIndex, TrigramIndex,
+    SUBSET_SORT_RATIO, file_stamp
 )
 
 # In-memory database for development
 # In a production environment, this would be replaced with a real database
 
 # Initialize database files if they don't exist
-DB_DIR = "db"
+DB_DIR = os.getenv("DB_DIR", "db")
 os.makedirs(DB_DIR, exist_ok=True)
 
 USERS_FILE = os.path.join(DB_DIR, "users.json")
 DATASETS_FILE = os.path.join(DB_DIR, "datasets.json")
 ACCESS_REQUESTS_FILE = os.path.join(DB_DIR, "access_requests.json")
 ACTIVITIES_FILE = os.path.join(DB_DIR, "activities.json")
+JOURNAL_FILE = os.path.join(DB_DIR, "journal.json")
+ACTIVITY_BACKLOG_FILE = os.path.join(DB_DIR, "activity_backlog.ndjson")
+CHANGES_FILE = os.path.join(DB_DIR, "changes.ndjson")
+WRITE_LOCK_FILE = os.path.join(DB_DIR, "write.lock")
+
+# How long an approved access request remains valid
+ACCESS_GRANT_DURATION = timedelta(days=365)
+
+# Dataset search falls back to typo-tolerant matching on name, keywords and
+# institution when the substring match finds fewer than this many datasets
+FUZZY_SEARCH_MIN_RESULTS = int(os.getenv("FUZZY_SEARCH_MIN_RESULTS", "5"))
+# Minimum trigram similarity (0-1) for a fuzzy match
+FUZZY_SEARCH_THRESHOLD = float(os.getenv("FUZZY_SEARCH_THRESHOLD", "0.4"))
 
 # Initialize database files with empty lists if they don't exist
 def init_db_file(file_path):
@@ -35,35 +67,545 @@ init_db_file(ACCESS_REQUESTS_FILE)
 init_db_file(ACTIVITIES_FILE)
 
 # Helper functions to read and write to JSON files
+# Read/parse and serialize/write are timed separately per collection
+def collection_name(file_path):
+    return os.path.splitext(os.path.basename(file_path))[0]
+
 def read_json_file(file_path):
+    collection = collection_name(file_path)
+    start = time.perf_counter()
+    with open(file_path, "r") as f:
+        raw = f.read()
+    read_done = time.perf_counter()
+    data = json.loads(raw)
+    STORAGE_SECONDS.observe(read_done - start, collection, "read")
+    STORAGE_SECONDS.observe(time.perf_counter() - read_done, collection, "parse")
+    STORAGE_BYTES.inc(collection, "read", amount=len(raw))
+    return data
+
+def write_json_file(file_path, data, changed=None):
+    # changed: the records this write added or modified, if the caller knows
+    # them; the collection's in-memory index then applies just those instead
+    # of being rebuilt from disk on its next use. Returns the file's stamps
+    # before and after the write.
+    collection = collection_name(file_path)
+    start = time.perf_counter()
+    raw = json.dumps(data, default=str)
+    serialize_done = time.perf_counter()
+    # Write to a temporary file and rename it over the original, so readers
+    # (including streaming exports holding the old file open) never see a
+    # partially written collection
+    # The new file is fsynced before the rename; the rename itself is made
+    # durable by fsync_directory, once per transaction
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(file_path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(raw)
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    
+    # Readers of the collection's index wait from the rename until the index
+    # has applied it (see CollectionIndex.lock)
+    index = COLLECTION_INDEXES.get(file_path)
+    with index.lock if index is not None else nullcontext():
+        old_stamp = file_stamp(file_path)
+        try:
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        new_stamp = file_stamp(file_path)
+        if changed is not None and index is not None:
+            index.committed(changed, old_stamp, new_stamp)
+    STORAGE_SECONDS.observe(serialize_done - start, collection, "serialize")
+    STORAGE_SECONDS.observe(time.perf_counter() - serialize_done, collection, "write")
+    STORAGE_BYTES.inc(collection, "write", amount=len(raw))
+    return old_stamp, new_stamp
+
+def fsync_directory(path: str):
+    # Persist renames into path; Windows cannot open directories, and its
+    # renames need no separate flush
+    if os.name != "posix":
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def iter_json_file(file_path, chunk_size: int = 1 << 16) -> Iterator[Any]:
+    # Yield the items of a JSON array file one at a time, reading it in
+    # chunks, so memory stays flat however large the collection grows
+    decoder = json.JSONDecoder()
+    bytes_read = 0
     with open(file_path, "r") as f:
-        return json.load(f)
+        buffer = ""
+        pos = 0
+        eof = False
+        started = False
+        
+        while True:
+            # Skip whitespace and separators, refilling the buffer as needed
+            while True:
+                while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                    pos += 1
+                if pos < len(buffer) or eof:
+                    break
+                chunk = f.read(chunk_size)
+                bytes_read += len(chunk)
+                buffer, pos, eof = chunk, 0, not chunk
+            
+            if pos >= len(buffer):
+                break
+            if not started:
+                if buffer[pos] != "[":
+                    raise ValueError(f"{file_path} does not contain a JSON array")
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == "]":
+                break
+            
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                item, end = None, None
+            # An item that ends exactly at the buffer boundary may be truncated
+            # (a number, say), so only accept it once more input has been seen
+            if end is None or (end == len(buffer) and not eof):
+                if eof:
+                    raise ValueError(f"{file_path} ends in the middle of an item")
+                chunk = f.read(chunk_size)
+                bytes_read += len(chunk)
+                buffer, pos, eof = buffer[pos:] + chunk, 0, not chunk
+                continue
+            
+            pos = end
+            yield item
+    
+    STORAGE_BYTES.inc(collection_name(file_path), "stream", amount=bytes_read)
+
+# Transactions
+# Every write goes through a Transaction, which reads each collection it
+# touches at most once and stages the records it adds or changes. On commit
+# the staged records are numbered for the change feed and written to a
+# journal with a single fsync, then each collection file is rewritten and
+# fsynced, and the journal is removed only once the directory holding the new
+# files has been fsynced too; the entries are appended to the change log. If
+# the process or the machine stops in between, the next transaction (or the
+# next start) replays the journal.
+# One storage lock serializes transactions across threads, and an flock on
+# write.lock across worker processes (see workers.py). Each change log entry
+# carries its collection file's stamps before and after the commit, so other
+# workers can apply it to their indexes with the same committed() hook.
+# Activity log entries are the exception: a transaction commits them to a
+# small backlog file, and flush_activity_backlog moves them into
+# activities.json (and the change log) in batches, so logging an activity
+# never rewrites the whole log.
+COLLECTION_FILES = {
+    collection_name(file_path): file_path
+    for file_path in (USERS_FILE, DATASETS_FILE, ACCESS_REQUESTS_FILE, ACTIVITIES_FILE)
+}
+
+# Entries kept for /changes; older cursors have to resync
+CHANGE_LOG_RETENTION = int(os.getenv("CHANGE_LOG_RETENTION", "100000"))
+
+storage_lock = threading.RLock()
+write_lock = WriteLock(WRITE_LOCK_FILE)
+change_log = ChangeLog(CHANGES_FILE, CHANGE_LOG_RETENTION)
+# Set by serve.py for its workers; unset, the app runs as one process
+worker_channel = WorkerChannel(os.getenv("WORKER_SOCKET_DIR"))
+
+class ActivityBacklog:
+    """Committed activity log entries not yet written to activities.json.
+
+    One JSON entry per line, appended and fsynced as part of a commit; the
+    entries carry consecutive numeric ids, so the first and last line give
+    the length. Writers hold the storage and write locks.
+    """
+    
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        if not os.path.exists(file_path):
+            open(file_path, "ab").close()
+            fsync_directory(os.path.dirname(file_path) or ".")
+    
+    def read(self) -> List[Dict[str, Any]]:
+        with open(self.file_path, "rb") as f:
+            return [entry for entry in map(parse_line, f) if entry is not None]
+    
+    def ends(self) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        # The first and last entries, reading only the ends of the file
+        with open(self.file_path, "rb") as f:
+            first = parse_line(f.readline())
+            if first is None:
+                return None, None
+            size = f.seek(0, os.SEEK_END)
+            chunk = 1 << 12
+            while True:
+                f.seek(max(size - chunk, 0))
+                for line in reversed(f.read().splitlines(keepends=True)[1:]):
+                    last = parse_line(line)
+                    if last is not None:
+                        return first, last
+                if chunk >= size:
+                    return first, first
+                chunk *= 2
+    
+    def __len__(self) -> int:
+        first, last = self.ends()
+        return 0 if first is None else int(last["id"]) - int(first["id"]) + 1
+    
+    def append(self, entries: List[Dict[str, Any]]):
+        data = "".join(json.dumps(entry, default=str) + "\n" for entry in entries).encode()
+        with open(self.file_path, "a+b") as f:
+            size = f.seek(0, os.SEEK_END)
+            if size:
+                # A crash mid-append leaves a torn last line; start a new one
+                f.seek(size - 1)
+                if f.read(1) != b"\n":
+                    data = b"\n" + data
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        STORAGE_BYTES.inc("activity_backlog", "write", amount=len(data))
+    
+    def clear(self):
+        with open(self.file_path, "r+b") as f:
+            f.truncate(0)
+            os.fsync(f.fileno())
+
+def parse_line(line: bytes) -> Optional[Dict[str, Any]]:
+    # None for a blank, torn or unfinished line
+    if not line.endswith(b"\n"):
+        return None
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
+
+activity_backlog = ActivityBacklog(ACTIVITY_BACKLOG_FILE)
+
+class Transaction:
+    def __init__(self):
+        self._rows: Dict[str, List[Dict[str, Any]]] = {}
+        self._changed: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._notes: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        # Activity log entries for the backlog
+        self.logged: List[Dict[str, Any]] = []
+        self._after_commit: List[Callable[[], None]] = []
+    
+    def rows(self, file_path: str) -> List[Dict[str, Any]]:
+        # The collection as this transaction sees it, staged changes included
+        if file_path not in self._rows:
+            self._rows[file_path] = read_json_file(file_path)
+        return self._rows[file_path]
+    
+    def insert(self, file_path: str, record: Dict[str, Any]) -> Dict[str, Any]:
+        self.rows(file_path).append(record)
+        return self.stage(file_path, record)
+    
+    def stage(self, file_path: str, record: Dict[str, Any], **notes: Any) -> Dict[str, Any]:
+        # Mark a record from rows() as changed; notes are extra fields for its
+        # change log entry, for other workers (see sync_remote_changes)
+        self._changed.setdefault(file_path, {})[record["id"]] = record
+        if notes:
+            self._notes[(collection_name(file_path), record["id"])] = notes
+        return record
+    
+    def log(self, activity: Dict[str, Any]) -> Dict[str, Any]:
+        # Commit an activity log entry to the backlog, with everything else
+        # in this transaction
+        self.logged.append(activity)
+        return activity
+    
+    def after_commit(self, callback: Callable[[], None]):
+        self._after_commit.append(callback)
+    
+    def commit(self):
+        if self._changed or self.logged:
+            entries = change_log.number({
+                collection_name(file_path): records.values()
+                for file_path, records in self._changed.items()
+            })
+            for entry in entries:
+                entry.update(self._notes.get((entry["collection"], entry["id"]), {}))
+            write_journal(entries, self.logged)
+            stamps = {
+                collection_name(file_path): write_json_file(file_path, self._rows[file_path], changed=list(records.values()))
+                for file_path, records in self._changed.items()
+            }
+            # The journal may only go once the new collection files are
+            # durable
+            fsync_directory(DB_DIR)
+            for entry in entries:
+                entry["stamps"] = stamps[entry["collection"]]
+            if self.logged:
+                activity_backlog.append(self.logged)
+            change_log.append(entries)
+            os.remove(JOURNAL_FILE)
+            if entries:
+                worker_channel.notify()
+        for callback in self._after_commit:
+            callback()
+
+@contextmanager
+def transaction(tx: Optional[Transaction] = None):
+    # Joins the caller's transaction if given, otherwise runs a new one that
+    # commits when the block exits without an exception
+    if tx is not None:
+        yield tx
+        return
+    with storage_lock, write_lock:
+        # Catch up on what other workers committed, so numbering continues
+        # after their entries
+        sync_remote_changes()
+        if os.path.exists(JOURNAL_FILE):
+            recover_journal()
+        tx = Transaction()
+        yield tx
+        tx.commit()
+
+def write_journal(entries: List[Dict[str, Any]], logged: List[Dict[str, Any]]):
+    raw = json.dumps({"entries": entries, "logged": logged}, default=str)
+    fd, tmp_path = tempfile.mkstemp(dir=DB_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(raw)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, JOURNAL_FILE)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    # The commit point: no collection file is replaced before this
+    fsync_directory(DB_DIR)
+    STORAGE_BYTES.inc("journal", "write", amount=len(raw))
+
+def recover_journal():
+    # Reapply a committed transaction whose collection writes did not all
+    # finish; records are matched by id, so replaying twice is harmless
+    try:
+        with open(JOURNAL_FILE, "r") as f:
+            journal = json.load(f)
+    except FileNotFoundError:
+        return
+    # A bare list is a journal written before activity entries had a backlog
+    entries, logged = (journal, []) if isinstance(journal, list) else (journal["entries"], journal["logged"])
+    
+    changes: Dict[str, List[Dict[str, Any]]] = {}
+    for entry in entries:
+        changes.setdefault(entry["collection"], []).append(entry["record"])
+    for collection, records in changes.items():
+        file_path = COLLECTION_FILES[collection]
+        rows = read_json_file(file_path)
+        positions = {row["id"]: i for i, row in enumerate(rows)}
+        for record in records:
+            if record["id"] in positions:
+                rows[positions[record["id"]]] = record
+            else:
+                rows.append(record)
+        write_json_file(file_path, rows)
+    fsync_directory(DB_DIR)
+    if logged:
+        # The commit may have reached the backlog before it stopped
+        backlogged = {entry["id"] for entry in activity_backlog.read()}
+        activity_backlog.append([entry for entry in logged if entry["id"] not in backlogged])
+    # Entries the change log already has are skipped
+    change_log.append(entries)
+    os.remove(JOURNAL_FILE)
+
+with storage_lock, write_lock:
+    recover_journal()
+
+# Dataset field normalization
+# sample_size and year_collected are free text ("1,200 participants",
+# "2018-2021"); numeric versions are derived on write for range queries
+NUMBER = r"(?<![\d.,\-–])(\d{1,3}(?:,\d{3})+|\d+)(?![.,]?\d)"
+# A count of people or samples, allowing two words in between ("500 healthy
+# controls"); intervening numbers break the match, so "3 sites with 40
+# patients" counts only the patients
+PARTICIPANT_COUNT = re.compile(
+    NUMBER + r"(?:\s+[^\W\d_][\w-]*){0,2}?\s+(?:participants?|patients?|subjects?|controls?|cases?|"
+    r"individuals?|people|persons?|volunteers?|respondents?|children|adults?|infants?|women|men|"
+    r"donors?|samples?|cohort members?)\b",
+    re.IGNORECASE
+)
+SAMPLE_SIZE_NUMBER = re.compile(NUMBER + r"(?!\s*[-–]\s*\d)(\s+\w+)?")
+# Numbers counting something other than the sample
+OTHER_COUNT = re.compile(
+    r"\s+(?:sites?|centres?|centers?|hospitals?|clinics?|countries|cities|regions?|"
+    r"years?|months?|weeks?|days?|visits?|waves?|timepoints?)$",
+    re.IGNORECASE
+)
+YEAR = re.compile(r"(?<!\d)(?:19|20)\d{2}(?!\d)")
+
+def parse_sample_size(text: Optional[str]) -> Optional[int]:
+    # Sum of the participant counts: "500 patients, 500 controls" -> 1000.
+    # Without any, the largest other number that is neither part of a range
+    # (ages, years) nor a count of sites, visits and the like:
+    # "N=250 across 3 sites" -> 250
+    if not text:
+        return None
+    counts = [int(match.replace(",", "")) for match in PARTICIPANT_COUNT.findall(text)]
+    if counts:
+        return sum(counts)
+    numbers = [
+        int(number.replace(",", ""))
+        for number, unit in SAMPLE_SIZE_NUMBER.findall(text)
+        if not OTHER_COUNT.match(unit)
+    ]
+    return max(numbers) if numbers else None
+
+def parse_year_range(text: Optional[str]) -> Tuple[Optional[int], Optional[int]]:
+    if not text:
+        return None, None
+    years = [int(year) for year in YEAR.findall(text)]
+    if not years:
+        return None, None
+    return min(years), max(years)
+
+def stringify_datetimes(record: Dict[str, Any]) -> Dict[str, Any]:
+    # The form records take after a round trip through the JSON file
+    return {key: str(value) if isinstance(value, datetime) else value for key, value in record.items()}
+
+def normalize_dataset(dataset: Dict[str, Any]) -> Dict[str, Any]:
+    dataset = stringify_datetimes(dataset)
+    dataset["sample_size_value"] = parse_sample_size(dataset.get("sample_size"))
+    dataset["year_collected_start"], dataset["year_collected_end"] = parse_year_range(dataset.get("year_collected"))
+    return dataset
 
-def write_json_file(file_path, data):
-    with open(file_path, "w") as f:
-        json.dump(data, f, default=str)
+# In-memory indexes
+# Each index mirrors one collection file; reads call ensure(), which only
+# stats the file unless another writer has changed it
+def timestamp_key(field: str):
+    return lambda record: to_epoch(record[field]) if record.get(field) else None
+
+def dataset_record(dataset: Dict[str, Any]) -> DatasetRecord:
+    return DatasetRecord(normalize_dataset(dataset))
+
+# Index records are compact read-only records (see records.py)
+dataset_index = CollectionIndex(DATASETS_FILE, read_json_file, prepare=dataset_record)
+datasets_by_type = dataset_index.add_index(HashIndex(lambda d: d["data_type"]))
+datasets_by_sample_size = dataset_index.add_index(SortedIndex(lambda d: d["sample_size_value"]))
+datasets_by_start_year = dataset_index.add_index(SortedIndex(lambda d: d["year_collected_start"]))
+datasets_by_end_year = dataset_index.add_index(SortedIndex(lambda d: d["year_collected_end"]))
+dataset_words = dataset_index.add_index(TrigramIndex(
+    lambda d: " ".join(filter(None, (d["name"], d.get("keywords"), d["institution"])))
+))
+# Narrows the exact search= match (see dataset_matches) to likely datasets
+dataset_text = dataset_index.add_index(SubstringIndex(
+    lambda d: " ".join(filter(None, (d["name"], d["description"], d.get("keywords"))))
+))
+
+access_request_index = CollectionIndex(ACCESS_REQUESTS_FILE, read_json_file, prepare=AccessRequestRecord)
+access_requests_by_user = access_request_index.add_index(HashIndex(lambda r: r["user_id"]))
+access_requests_by_dataset = access_request_index.add_index(HashIndex(lambda r: r["dataset_id"]))
+access_requests_by_status = access_request_index.add_index(HashIndex(lambda r: r["status"]))
+
+# Entitlements: approved requests by (user, dataset) and by user; expiry is
+# checked when read
+grants_by_user_dataset = access_request_index.add_index(HashIndex(
+    lambda r: (r["user_id"], r["dataset_id"]) if r["status"] == "approved" else None
+))
+grants_by_user = access_request_index.add_index(HashIndex(
+    lambda r: r["user_id"] if r["status"] == "approved" else None
+))
+# Approved requests by expiry_date, for the expiry scheduler
+grant_expiries = access_request_index.add_index(DeadlineIndex(
+    lambda r: to_epoch(r["expiry_date"]) if r["status"] == "approved" and r.get("expiry_date") else None
+))
+
+def dataset_phrases(dataset: Dict[str, Any]):
+    yield "name", dataset["name"]
+    yield "institution", dataset["institution"]
+    for keyword in (dataset.get("keywords") or "").split(","):
+        yield "keyword", keyword
+
+def dataset_popularity(dataset: Dict[str, Any]) -> int:
+    # Weighted like trending events, plus one so unseen datasets still count
+    return (1 + dataset.get("view_count", 0) * EVENT_WEIGHTS["dataset_viewed"]
+            + dataset.get("access_count", 0) * EVENT_WEIGHTS["access_granted"])
+
+dataset_suggestions = dataset_index.add_index(SuggestIndex(dataset_phrases, dataset_popularity))
+dataset_similarity = dataset_index.add_index(SimilarityIndex(
+    lambda d: " ".join(filter(None, (d["description"], d.get("keywords"), d["data_type"])))
+))
+
+# Sort orders for the sort= parameter, kept up to date by every write
+DATASET_SORTS = {
+    "created_at": dataset_index.add_index(SortedIndex(timestamp_key("created_at"))),
+    "updated_at": dataset_index.add_index(SortedIndex(timestamp_key("updated_at"))),
+    "name": dataset_index.add_index(SortedIndex(lambda d: d["name"].casefold())),
+    "access_count": dataset_index.add_index(SortedIndex(lambda d: d.get("access_count", 0))),
+    "view_count": dataset_index.add_index(SortedIndex(lambda d: d.get("view_count", 0))),
+    "sample_size": datasets_by_sample_size,
+}
+ACCESS_REQUEST_SORTS = {
+    "created_at": access_request_index.add_index(SortedIndex(timestamp_key("created_at"))),
+    "updated_at": access_request_index.add_index(SortedIndex(timestamp_key("updated_at"))),
+}
+
+user_index = CollectionIndex(USERS_FILE, read_json_file, prepare=UserRecord)
+users_by_username = user_index.add_index(HashIndex(lambda u: u["username"]))
+users_by_email = user_index.add_index(HashIndex(lambda u: u["email"]))
+users_by_institution = user_index.add_index(HashIndex(lambda u: u["institution"].casefold()))
+users_by_admin = user_index.add_index(HashIndex(lambda u: bool(u.get("is_admin"))))
+users_by_active = user_index.add_index(HashIndex(lambda u: bool(u.get("is_active", True))))
+user_words = user_index.add_index(PrefixIndex(
+    lambda u: " ".join((u["full_name"], u["email"], u["username"]))
+))
+
+USER_SORTS = {
+    "created_at": user_index.add_index(SortedIndex(timestamp_key("created_at"))),
+    "username": user_index.add_index(SortedIndex(lambda u: u["username"].casefold())),
+    "full_name": user_index.add_index(SortedIndex(lambda u: u["full_name"].casefold())),
+    "email": user_index.add_index(SortedIndex(lambda u: u["email"].casefold())),
+    "institution": user_index.add_index(SortedIndex(lambda u: u["institution"].casefold())),
+}
+
+# Column-wise copy of the activity log for aggregations (see activity_store.py)
+activity_columns = ActivityColumns(ACTIVITIES_FILE, read_json_file, os.path.join(DB_DIR, "activity_columns"))
+
+COLLECTION_INDEXES = {
+    USERS_FILE: user_index,
+    DATASETS_FILE: dataset_index,
+    ACCESS_REQUESTS_FILE: access_request_index,
+    ACTIVITIES_FILE: activity_columns,
+}
+
+def parse_sort(sort: str) -> Tuple[str, bool]:
+    # "name" sorts ascending, "-name" descending
+    return sort.lstrip("-"), sort.startswith("-")
 
 # User database operations
-def get_user(username: Optional[str] = None, id: Optional[str] = None) -> Optional[UserInDB]:
-    users = read_json_file(USERS_FILE)
+def get_user(username: Optional[str] = None, id: Optional[str] = None, email: Optional[str] = None) -> Optional[UserInDB]:
+    records = user_index.ensure().records
     
     if username:
-        for user in users:
-            if user["username"] == username:
-                return UserInDB(**user)
+        # First in storage order, as with a scan, should a name be taken twice
+        matches = users_by_username.get(username)
+        if matches:
+            return UserInDB(**records[user_index.in_storage_order(matches)[0]])
+    
+    if email:
+        matches = users_by_email.get(email)
+        if matches:
+            return UserInDB(**records[user_index.in_storage_order(matches)[0]])
     
     if id:
-        for user in users:
-            if user["id"] == id:
-                return UserInDB(**user)
+        user = records.get(id)
+        if user is not None:
+            return UserInDB(**user)
     
     return None
 
-def create_user(user: UserInDB) -> User:
-    users = read_json_file(USERS_FILE)
-    user_dict = user.dict()
-    users.append(user_dict)
-    write_json_file(USERS_FILE, users)
+def create_user(user: UserInDB, tx: Optional[Transaction] = None) -> User:
+    with transaction(tx) as tx:
+        tx.insert(USERS_FILE, user.dict())
     
     # Return User model (without hashed_password)
     return User(
@@ -78,170 +620,670 @@ def create_user(user: UserInDB) -> User:
         avatar_url=user.avatar_url
     )
 
-def update_user(user_id: str, user_update: UserUpdate) -> User:
-    users = read_json_file(USERS_FILE)
-    
-    for i, user in enumerate(users):
-        if user["id"] == user_id:
-            # Update only provided fields
-            update_dict = user_update.dict(exclude_unset=True)
-            for key, value in update_dict.items():
-                users[i][key] = value
-            
-            write_json_file(USERS_FILE, users)
-            
-            # Return updated user
-            return User(**users[i])
+def user_conflict(username: str, email: str, tx: Transaction) -> Optional[str]:
+    # Which of username and email is already taken, checked against the
+    # transaction's rows so a concurrent registration cannot slip in between
+    users = tx.rows(USERS_FILE)
+    if any(user["username"] == username for user in users):
+        return "username"
+    if any(user["email"] == email for user in users):
+        return "email"
+    return None
+
+def update_user(user_id: str, user_update: UserUpdate, tx: Optional[Transaction] = None) -> User:
+    with transaction(tx) as tx:
+        users = tx.rows(USERS_FILE)
+        
+        for i, user in enumerate(users):
+            if user["id"] == user_id:
+                # Update only provided fields
+                update_dict = user_update.dict(exclude_unset=True)
+                for key, value in update_dict.items():
+                    users[i][key] = value
+                
+                tx.stage(USERS_FILE, users[i])
+                
+                # Return updated user
+                return User(**users[i])
     
     return None
 
-def get_users(skip: int = 0, limit: int = 100) -> List[User]:
-    users = read_json_file(USERS_FILE)
-    return [User(**user) for user in users[skip:skip+limit]]
+def get_users(
+    skip: int = 0,
+    limit: int = 100,
+    search: Optional[str] = None,
+    institution: Optional[str] = None,
+    is_admin: Optional[bool] = None,
+    is_active: Optional[bool] = None,
+    sort: Optional[str] = None
+) -> List[User]:
+    # Filters intersect index lookups; search matches word prefixes of the
+    # full name, email and username
+    records = user_index.ensure().records
+    
+    candidates = None
+    for ids in (
+        user_words.search(search) if search else None,
+        users_by_institution.get(institution.casefold()) if institution else None,
+        users_by_admin.get(is_admin) if is_admin is not None else None,
+        users_by_active.get(is_active) if is_active is not None else None,
+    ):
+        if ids is not None:
+            candidates = set(ids) if candidates is None else candidates & ids
+    
+    if sort:
+        field, descending = parse_sort(sort)
+        ids = user_index.ordered(USER_SORTS[field], descending, candidates)
+    elif candidates is None:
+        ids = iter(records)
+    else:
+        ids = user_index.in_storage_order(candidates)
+    
+    return [User(**records[user_id]) for user_id in itertools.islice(ids, skip, skip + limit)]
+
+def get_users_by_ids(user_ids: List[str]) -> List[Optional[User]]:
+    # Index lookups for the whole batch; results follow the order of
+    # user_ids, with None for unknown ids
+    records = user_index.ensure().records
+    return [User(**records[user_id]) if user_id in records else None for user_id in user_ids]
+
+def get_user_keys() -> Tuple[set, set]:
+    # Usernames and emails already taken, for uniqueness checks on import
+    user_index.ensure()
+    return set(users_by_username.values()), set(users_by_email.values())
 
 # Dataset database operations
 def get_dataset(dataset_id: str) -> Optional[Dataset]:
-    datasets = read_json_file(DATASETS_FILE)
-    
-    for dataset in datasets:
-        if dataset["id"] == dataset_id:
-            return Dataset(**dataset)
-    
-    return None
+    dataset = dataset_index.ensure().records.get(dataset_id)
+    if dataset is None:
+        return None
+    return Dataset(**with_pending_counts(dataset))
 
-def create_dataset(dataset: DatasetInDB) -> Dataset:
-    datasets = read_json_file(DATASETS_FILE)
-    dataset_dict = dataset.dict()
-    datasets.append(dataset_dict)
-    write_json_file(DATASETS_FILE, datasets)
+def datasets_generation() -> int:
+    # Changes whenever the dataset collection does, for caches of derived results
+    return dataset_index.ensure().generation
+
+def get_datasets_by_ids(dataset_ids: List[str]) -> List[Optional[Dataset]]:
+    # Index lookups for the whole batch; results follow the order of
+    # dataset_ids, with None for unknown ids
+    records = dataset_index.ensure().records
+    return [
+        Dataset(**with_pending_counts(records[dataset_id])) if dataset_id in records else None
+        for dataset_id in dataset_ids
+    ]
+
+def create_dataset(dataset: DatasetInDB, tx: Optional[Transaction] = None) -> Dataset:
+    dataset_dict = normalize_dataset(dataset.dict())
+    with transaction(tx) as tx:
+        tx.insert(DATASETS_FILE, dataset_dict)
     
     return Dataset(**dataset_dict)
 
-def update_dataset(dataset_id: str, dataset_update: DatasetUpdate) -> Dataset:
-    datasets = read_json_file(DATASETS_FILE)
-    
-    for i, dataset in enumerate(datasets):
-        if dataset["id"] == dataset_id:
-            # Update only provided fields
-            update_dict = dataset_update.dict(exclude_unset=True)
-            for key, value in update_dict.items():
-                datasets[i][key] = value
-            
-            # Update the updated_at timestamp
-            datasets[i]["updated_at"] = datetime.utcnow()
-            
-            write_json_file(DATASETS_FILE, datasets)
-            
-            # Return updated dataset
-            return Dataset(**datasets[i])
+def update_dataset(dataset_id: str, dataset_update: DatasetUpdate, tx: Optional[Transaction] = None) -> Dataset:
+    with transaction(tx) as tx:
+        datasets = tx.rows(DATASETS_FILE)
+        
+        for i, dataset in enumerate(datasets):
+            if dataset["id"] == dataset_id:
+                # Update only provided fields
+                update_dict = dataset_update.dict(exclude_unset=True)
+                for key, value in update_dict.items():
+                    datasets[i][key] = value
+                
+                # Update the updated_at timestamp
+                datasets[i]["updated_at"] = datetime.utcnow()
+                datasets[i] = normalize_dataset(datasets[i])
+                
+                tx.stage(DATASETS_FILE, datasets[i])
+                
+                # Return updated dataset
+                return Dataset(**datasets[i])
     
     return None
 
-def get_datasets(skip: int = 0, limit: int = 100, search: Optional[str] = None, data_type: Optional[str] = None) -> List[Dataset]:
-    datasets = read_json_file(DATASETS_FILE)
-    
-    # Apply filters
-    filtered_datasets = datasets
-    
+def suggest_datasets(prefix: str, limit: int = 10) -> List[Tuple[str, str, int]]:
+    dataset_index.ensure()
+    return dataset_suggestions.suggest(prefix, limit)
+
+def get_similar_datasets(dataset_id: str, limit: int = 10) -> Optional[List[Tuple[Dataset, float]]]:
+    # None if the dataset does not exist
+    records = dataset_index.ensure().records
+    if dataset_id not in records:
+        return None
+    similar = dataset_similarity.similar(dataset_id, limit)
+    return [(Dataset(**with_pending_counts(records[other])), score) for other, score in similar]
+
+def refresh_dataset_similarity() -> bool:
+    # Fold datasets written since the last refresh into the similarity matrix
+    if not dataset_similarity.stale:
+        return False
+    dataset_similarity.refresh()
+    return True
+
+def dataset_matches(dataset: Dict[str, Any], search: Optional[str] = None, data_type: Optional[str] = None) -> bool:
     if search:
         search = search.lower()
-        filtered_datasets = [d for d in filtered_datasets if 
-                           search in d["name"].lower() or 
-                           search in d["description"].lower() or
-                           (d["keywords"] and search in d["keywords"].lower())]
+        if not (search in dataset["name"].lower() or
+                search in dataset["description"].lower() or
+                (dataset["keywords"] and search in dataset["keywords"].lower())):
+            return False
+    
+    if data_type and dataset["data_type"] != data_type:
+        return False
     
+    return True
+
+def dataset_candidates(
+    data_type: Optional[str] = None,
+    min_sample_size: Optional[int] = None,
+    max_sample_size: Optional[int] = None,
+    collected_from: Optional[int] = None,
+    collected_to: Optional[int] = None
+) -> Optional[Set[str]]:
+    # Ids matching the indexed filters; None if no indexed filter was given.
+    # Range filters cost O(log n + k) on the sorted indexes.
+    sets = []
     if data_type:
-        filtered_datasets = [d for d in filtered_datasets if d["data_type"] == data_type]
+        sets.append(datasets_by_type.get(data_type))
+    if min_sample_size is not None or max_sample_size is not None:
+        sets.append(set(datasets_by_sample_size.range(min_sample_size, max_sample_size)))
+    if collected_from is not None or collected_to is not None:
+        # Collection period [start, end] overlaps [collected_from, collected_to]:
+        # scan whichever bound selects fewer datasets and check the other
+        records = dataset_index.records
+        by_start = datasets_by_start_year.count(None, collected_to) if collected_to is not None else None
+        by_end = datasets_by_end_year.count(collected_from, None) if collected_from is not None else None
+        if by_end is None or (by_start is not None and by_start <= by_end):
+            ids = datasets_by_start_year.range(None, collected_to)
+            if collected_from is not None:
+                ids = [i for i in ids if records[i]["year_collected_end"] >= collected_from]
+        else:
+            ids = datasets_by_end_year.range(collected_from, None)
+            if collected_to is not None:
+                ids = [i for i in ids if records[i]["year_collected_start"] <= collected_to]
+        sets.append(set(ids))
+    
+    if not sets:
+        return None
+    sets.sort(key=len)
+    return sets[0].intersection(*sets[1:])
+
+def get_datasets(
+    skip: int = 0,
+    limit: int = 100,
+    search: Optional[str] = None,
+    data_type: Optional[str] = None,
+    min_sample_size: Optional[int] = None,
+    max_sample_size: Optional[int] = None,
+    collected_from: Optional[int] = None,
+    collected_to: Optional[int] = None,
+    sort: Optional[str] = None
+) -> List[Dataset]:
+    records = dataset_index.ensure().records
+    
+    # Apply indexed filters and the search's word lookup, then walk the
+    # matches in the requested order (storage order by default) and check
+    # the search text on what is left
+    candidates = dataset_candidates(data_type, min_sample_size, max_sample_size, collected_from, collected_to)
+    subset = candidates
+    if search:
+        possible = dataset_text.candidates(search)
+        if possible is not None:
+            subset = possible if subset is None else subset & possible
+    if sort:
+        field, descending = parse_sort(sort)
+        order = DATASET_SORTS[field]
+        ids = dataset_index.ordered(order, descending, subset)
+    elif subset is None:
+        ids = iter(records)
+    elif len(subset) * SUBSET_SORT_RATIO < len(records):
+        ids = iter(dataset_index.in_storage_order(subset))
+    else:
+        # Most of the collection: filter it in order, stopping at the page
+        ids = (i for i in records if i in subset)
+    if search:
+        ids = (i for i in ids if dataset_matches(records[i], search))
+        
+        # Too few exact hits: the whole match set is known after this
+        # peek, so add fuzzy matches to it
+        exact = list(itertools.islice(ids, FUZZY_SEARCH_MIN_RESULTS))
+        if len(exact) < FUZZY_SEARCH_MIN_RESULTS:
+            fuzzy = [
+                i for i, _ in dataset_words.search(search, FUZZY_SEARCH_THRESHOLD)
+                if (candidates is None or i in candidates) and i not in exact
+            ]
+            if sort:
+                # Exact and fuzzy matches together in the requested order
+                ids = dataset_index.ordered(order, descending, set(exact) | set(fuzzy))
+            else:
+                # Exact matches first, then fuzzy ones by similarity
+                ids = iter(exact + fuzzy)
+        else:
+            ids = itertools.chain(exact, ids)
     
     # Apply pagination
-    paginated_datasets = filtered_datasets[skip:skip+limit]
+    paginated_datasets = itertools.islice(ids, skip, skip + limit)
     
-    return [Dataset(**dataset) for dataset in paginated_datasets]
+    return [Dataset(**with_pending_counts(records[i])) for i in paginated_datasets]
 
-# Access request database operations
-def get_access_request(request_id: str) -> Optional[AccessRequest]:
-    requests = read_json_file(ACCESS_REQUESTS_FILE)
+def iter_datasets(search: Optional[str] = None, data_type: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    for dataset in iter_json_file(DATASETS_FILE):
+        if dataset_matches(dataset, search, data_type):
+            yield with_pending_counts(dataset)
+
+# Dataset counters (views and access grants)
+# Increments are buffered in memory and written to datasets.json in batches
+dataset_counters = CounterBuffer()
+
+def record_dataset_view(dataset_id: str):
+    dataset_counters.incr(dataset_id, "view_count")
+    trending_datasets.record(dataset_id, "dataset_viewed")
+
+def record_dataset_grant(dataset_id: str):
+    dataset_counters.incr(dataset_id, "access_count")
+
+def with_pending_counts(dataset: Dict[str, Any]) -> Dict[str, Any]:
+    # Overlay increments that have not been flushed yet so readers see
+    # near-real-time totals
+    pending = dataset_counters.pending(dataset["id"])
+    if not pending:
+        return dataset
     
-    for request in requests:
-        if request["id"] == request_id:
-            return AccessRequest(**request)
+    dataset = dict(dataset)
+    for field, amount in pending.items():
+        dataset[field] = dataset.get(field, 0) + amount
+    return dataset
+
+def flush_dataset_counters() -> int:
+    pending = dataset_counters.drain()
+    if not pending:
+        return 0
     
-    return None
+    # Views are not activities; the change log carries them to the other
+    # workers' trending counts, dated at the flush
+    flushed_at = datetime.utcnow().isoformat()
+    try:
+        with transaction() as tx:
+            for dataset in tx.rows(DATASETS_FILE):
+                fields = pending.get(dataset["id"])
+                if fields:
+                    for field, amount in fields.items():
+                        dataset[field] = dataset.get(field, 0) + amount
+                    if fields.get("view_count"):
+                        tx.stage(DATASETS_FILE, dataset, views=fields["view_count"], viewed_at=flushed_at)
+                    else:
+                        tx.stage(DATASETS_FILE, dataset)
+    except Exception:
+        dataset_counters.restore(pending)
+        raise
+    
+    return len(pending)
+
+# Bulk import operations
+# The records and their activities are committed in one transaction, so each
+# collection is read and written once for the whole batch
+def import_users(users: List[UserInDB]) -> int:
+    with transaction() as tx:
+        for user in users:
+            tx.insert(USERS_FILE, user.dict())
+        
+        create_activities([
+            ActivityCreate(
+                type="user_registered",
+                user_id=None,
+                target_id=user.id,
+                dataset_id=None,
+                description=f"User {user.username} registered"
+            )
+            for user in users
+        ], tx=tx)
+    return len(users)
 
-def create_access_request(request: AccessRequestInDB) -> AccessRequest:
-    requests = read_json_file(ACCESS_REQUESTS_FILE)
+def import_datasets(datasets: List[DatasetInDB], owner: User) -> int:
+    with transaction() as tx:
+        for dataset in datasets:
+            tx.insert(DATASETS_FILE, normalize_dataset(dataset.dict()))
+        
+        create_activities([
+            ActivityCreate(
+                type="dataset_uploaded",
+                user_id=owner.id,
+                target_id=None,
+                dataset_id=dataset.id,
+                description=f"Dataset {dataset.name} uploaded by {owner.username}"
+            )
+            for dataset in datasets
+        ], tx=tx)
+    return len(datasets)
+
+# Access request database operations
+def get_access_request(request_id: str) -> Optional[AccessRequest]:
+    request = access_request_index.ensure().records.get(request_id)
+    if request is None:
+        return None
+    return AccessRequest(**request)
+
+def create_access_request(request: AccessRequestInDB, tx: Optional[Transaction] = None) -> AccessRequest:
     request_dict = request.dict()
-    requests.append(request_dict)
-    write_json_file(ACCESS_REQUESTS_FILE, requests)
+    with transaction(tx) as tx:
+        tx.insert(ACCESS_REQUESTS_FILE, request_dict)
     
     return AccessRequest(**request_dict)
 
-def update_access_request(request_id: str, request_update: AccessRequestUpdate) -> AccessRequest:
-    requests = read_json_file(ACCESS_REQUESTS_FILE)
-    
-    for i, request in enumerate(requests):
+def has_pending_access_request(user_id: str, dataset_id: str, tx: Transaction) -> bool:
+    return any(
+        access_request_matches(request, user_id, dataset_id, "pending")
+        for request in tx.rows(ACCESS_REQUESTS_FILE)
+    )
+
+def access_request_status(request_id: str, tx: Transaction) -> Optional[str]:
+    # As of the transaction, for routes that checked it before starting one
+    for request in tx.rows(ACCESS_REQUESTS_FILE):
         if request["id"] == request_id:
-            # Update only provided fields
-            update_dict = request_update.dict(exclude_unset=True)
-            for key, value in update_dict.items():
-                requests[i][key] = value
-            
-            # Update the updated_at timestamp
-            requests[i]["updated_at"] = datetime.utcnow()
-            
-            write_json_file(ACCESS_REQUESTS_FILE, requests)
-            
-            # Return updated request
-            return AccessRequest(**requests[i])
+            return request["status"]
+    return None
+
+def update_access_request(request_id: str, request_update: AccessRequestUpdate, tx: Optional[Transaction] = None) -> AccessRequest:
+    with transaction(tx) as tx:
+        requests = tx.rows(ACCESS_REQUESTS_FILE)
+        
+        for i, request in enumerate(requests):
+            if request["id"] == request_id:
+                # Update only provided fields
+                update_dict = request_update.dict(exclude_unset=True)
+                for key, value in update_dict.items():
+                    requests[i][key] = value
+                
+                # Update the updated_at timestamp
+                requests[i]["updated_at"] = datetime.utcnow()
+                
+                tx.stage(ACCESS_REQUESTS_FILE, requests[i])
+                
+                # Return updated request
+                return AccessRequest(**requests[i])
     
     return None
 
+def access_request_matches(
+    request: Dict[str, Any],
+    user_id: Optional[str] = None,
+    dataset_id: Optional[str] = None,
+    status: Optional[str] = None
+) -> bool:
+    return ((not user_id or request["user_id"] == user_id) and
+            (not dataset_id or request["dataset_id"] == dataset_id) and
+            (not status or request["status"] == status))
+
 def get_access_requests(
     skip: int = 0, 
     limit: int = 100, 
     user_id: Optional[str] = None,
     dataset_id: Optional[str] = None,
-    status: Optional[str] = None
+    status: Optional[str] = None,
+    sort: Optional[str] = None
 ) -> List[AccessRequest]:
-    requests = read_json_file(ACCESS_REQUESTS_FILE)
+    records = access_request_index.ensure().records
     
     # Apply filters
-    filtered_requests = requests
-    
-    if user_id:
-        filtered_requests = [r for r in filtered_requests if r["user_id"] == user_id]
-    
-    if dataset_id:
-        filtered_requests = [r for r in filtered_requests if r["dataset_id"] == dataset_id]
+    candidates = None
+    if user_id or dataset_id or status:
+        sets = []
+        if user_id:
+            sets.append(access_requests_by_user.get(user_id))
+        if dataset_id:
+            sets.append(access_requests_by_dataset.get(dataset_id))
+        if status:
+            sets.append(access_requests_by_status.get(status))
+        sets.sort(key=len)
+        candidates = sets[0].intersection(*sets[1:])
     
-    if status:
-        filtered_requests = [r for r in filtered_requests if r["status"] == status]
+    if sort:
+        field, descending = parse_sort(sort)
+        ids = access_request_index.ordered(ACCESS_REQUEST_SORTS[field], descending, candidates)
+    elif candidates is not None:
+        ids = access_request_index.in_storage_order(candidates)
+    else:
+        ids = iter(records)
     
     # Apply pagination
-    paginated_requests = filtered_requests[skip:skip+limit]
+    paginated_requests = itertools.islice(ids, skip, skip + limit)
     
-    return [AccessRequest(**request) for request in paginated_requests]
+    return [AccessRequest(**records[request_id]) for request_id in paginated_requests]
 
-# Activity database operations
-def create_activity(activity: ActivityCreate) -> Activity:
-    activities = read_json_file(ACTIVITIES_FILE)
-    
-    activity_in_db = ActivityInDB(
-        id=str(len(activities) + 1),  # Simple ID generation
-        type=activity.type,
-        description=activity.description,
-        user_id=activity.user_id,
-        target_id=activity.target_id,
-        dataset_id=activity.dataset_id,
-        timestamp=datetime.utcnow()
+# Entitlement checks
+def active_grant(request_ids, now: float) -> Optional[Dict[str, Any]]:
+    # The approved request that stays valid longest, if any is still valid;
+    # a missing expiry_date never expires
+    records = access_request_index.records
+    best, best_expiry = None, now
+    for request_id in request_ids:
+        request = records[request_id]
+        expiry = to_epoch(request["expiry_date"]) if request.get("expiry_date") else float("inf")
+        if expiry > best_expiry:
+            best, best_expiry = request, expiry
+    return best
+
+def as_entitlement(request: Dict[str, Any]) -> Entitlement:
+    return Entitlement(
+        user_id=request["user_id"],
+        dataset_id=request["dataset_id"],
+        request_id=request["id"],
+        approved_at=request.get("approved_at"),
+        expiry_date=request.get("expiry_date")
     )
+
+def get_entitlement(user_id: str, dataset_id: str) -> Optional[Entitlement]:
+    access_request_index.ensure()
+    grant = active_grant(grants_by_user_dataset.get((user_id, dataset_id)), time.time())
+    return as_entitlement(grant) if grant is not None else None
+
+def get_entitlements(user_id: str) -> List[Entitlement]:
+    # One entitlement per dataset, ordered by dataset id
+    records = access_request_index.ensure().records
+    by_dataset: Dict[str, List[str]] = {}
+    for request_id in grants_by_user.get(user_id):
+        by_dataset.setdefault(records[request_id]["dataset_id"], []).append(request_id)
+    
+    now = time.time()
+    entitlements = []
+    for dataset_id in sorted(by_dataset):
+        grant = active_grant(by_dataset[dataset_id], now)
+        if grant is not None:
+            entitlements.append(as_entitlement(grant))
+    return entitlements
+
+# Grant expiry
+# Approved requests move to "expired" once their expiry_date passes. The
+# deadlines come from grant_expiries, loaded with the index and kept current
+# by every write, so a tick never scans the request history.
+def seconds_until_next_expiry() -> Optional[float]:
+    access_request_index.ensure()
+    deadline = grant_expiries.next_deadline()
+    return None if deadline is None else deadline - time.time()
+
+def expire_access_requests() -> int:
+    access_request_index.ensure()
+    due = grant_expiries.pop_due(time.time())
+    if not due:
+        return 0
+    
+    try:
+        with transaction() as tx:
+            due_ids = set(due)
+            expired = [r for r in tx.rows(ACCESS_REQUESTS_FILE) if r["id"] in due_ids and r["status"] == "approved"]
+            if not expired:
+                return 0
+            
+            now = datetime.utcnow()
+            for request in expired:
+                request.update(status="expired", updated_at=now)
+                tx.stage(ACCESS_REQUESTS_FILE, request)
+            
+            users = {user["id"]: user["username"] for user in tx.rows(USERS_FILE)}
+            datasets = {dataset["id"]: dataset["name"] for dataset in tx.rows(DATASETS_FILE)}
+            create_activities([
+                ActivityCreate(
+                    type="access_expired",
+                    user_id=None,
+                    target_id=request["user_id"],
+                    dataset_id=request["dataset_id"],
+                    description=f"Access to dataset {datasets.get(request['dataset_id'])} for user {users.get(request['user_id'])} expired"
+                )
+                for request in expired
+            ], tx=tx)
+    except Exception:
+        records = access_request_index.records
+        grant_expiries.restore((request_id, records[request_id]) for request_id in due if request_id in records)
+        raise
+    
+    return len(expired)
+
+def decide_access_requests(request_ids: List[str], decision: str, admin: User, all_or_nothing: bool = False) -> List[AccessRequestDecisionOutcome]:
+    # Approve or deny a batch of pending requests in one transaction: every
+    # collection involved is read once, and the requests and activities are
+    # each written once
+    with transaction() as tx:
+        by_id = {request["id"]: request for request in tx.rows(ACCESS_REQUESTS_FILE)}
+        
+        # Validate the whole batch first; errors are kept per position so a
+        # repeated id only fails on its repeats
+        errors: List[Optional[str]] = []
+        seen = set()
+        for request_id in request_ids:
+            request = by_id.get(request_id)
+            if request_id in seen:
+                errors.append("Duplicate request id in batch")
+            elif request is None:
+                errors.append("Access request not found")
+            elif request["status"] != "pending":
+                errors.append("Request is not in pending status")
+            else:
+                errors.append(None)
+            seen.add(request_id)
+        
+        if all_or_nothing and any(errors):
+            return [
+                AccessRequestDecisionOutcome(
+                    request_id=request_id,
+                    success=False,
+                    detail=error or "Not applied: the batch contains invalid requests"
+                )
+                for request_id, error in zip(request_ids, errors)
+            ]
+        
+        valid = [by_id[request_id] for request_id, error in zip(request_ids, errors) if error is None]
+        if valid:
+            users = {user["id"]: user["username"] for user in tx.rows(USERS_FILE)}
+            datasets = {dataset["id"]: dataset["name"] for dataset in tx.rows(DATASETS_FILE)}
+        
+        now = datetime.utcnow()
+        activities = []
+        for request in valid:
+            request["updated_at"] = now
+            if decision == "approve":
+                request.update(status="approved", approved_at=now, expiry_date=now + ACCESS_GRANT_DURATION)
+                activity_type, verb = "access_granted", "granted"
+            else:
+                request.update(status="denied", denied_at=now)
+                activity_type, verb = "access_denied", "denied"
+        
+            activities.append(ActivityCreate(
+                type=activity_type,
+                user_id=admin.id,
+                target_id=request["user_id"],
+                dataset_id=request["dataset_id"],
+                description=f"Admin {admin.username} {verb} access to dataset {datasets.get(request['dataset_id'])} for user {users.get(request['user_id'])}"
+            ))
+        
+        for request in valid:
+            tx.stage(ACCESS_REQUESTS_FILE, request)
+            if decision == "approve":
+                tx.after_commit(lambda dataset_id=request["dataset_id"]: record_dataset_grant(dataset_id))
+        if activities:
+            create_activities(activities, tx=tx)
     
-    activity_dict = activity_in_db.dict()
-    activities.append(activity_dict)
-    write_json_file(ACTIVITIES_FILE, activities)
+    return [
+        AccessRequestDecisionOutcome(request_id=request_id, success=False, detail=error) if error
+        else AccessRequestDecisionOutcome(request_id=request_id, success=True, request=AccessRequest(**by_id[request_id]))
+        for request_id, error in zip(request_ids, errors)
+    ]
+
+def iter_access_requests(
+    user_id: Optional[str] = None,
+    dataset_id: Optional[str] = None,
+    status: Optional[str] = None
+) -> Iterator[Dict[str, Any]]:
+    for request in iter_json_file(ACCESS_REQUESTS_FILE):
+        if access_request_matches(request, user_id, dataset_id, status):
+            yield request
+
+# Activity database operations
+# Activities are committed to the backlog (see Transactions) and reach
+# activities.json, the change log and trending when it is flushed. Ids stay
+# sequential across the two: the backlog continues from the last flushed id.
+def next_activity_id(tx: Transaction) -> int:
+    _, last = activity_backlog.ends()
+    flushed = int(last["id"]) if last is not None else activity_columns.ensure().size
+    return flushed + len(tx.logged) + 1
+
+def create_activity(activity: ActivityCreate, tx: Optional[Transaction] = None) -> Activity:
+    with transaction(tx) as tx:
+        activity_in_db = ActivityInDB(
+            id=str(next_activity_id(tx)),  # Simple ID generation
+            type=activity.type,
+            description=activity.description,
+            user_id=activity.user_id,
+            target_id=activity.target_id,
+            dataset_id=activity.dataset_id,
+            timestamp=datetime.utcnow()
+        )
+        
+        activity_dict = tx.log(activity_in_db.dict())
     
     return Activity(**activity_dict)
 
+def create_activities(activities: List[ActivityCreate], tx: Optional[Transaction] = None) -> int:
+    timestamp = datetime.utcnow()
+    with transaction(tx) as tx:
+        for activity in activities:
+            tx.log({
+                "id": str(next_activity_id(tx)),
+                "type": activity.type,
+                "description": activity.description,
+                "user_id": activity.user_id,
+                "target_id": activity.target_id,
+                "dataset_id": activity.dataset_id,
+                "timestamp": timestamp
+            })
+    return len(activities)
+
+def pending_activities() -> int:
+    return len(activity_backlog)
+
+def flush_activity_backlog() -> int:
+    # Move the backlog into activities.json in one rewrite
+    with transaction() as tx:
+        pending = activity_backlog.read()
+        if not pending:
+            return 0
+        stored = tx.rows(ACTIVITIES_FILE)
+        # A flush that stopped after its commit left its entries behind
+        written = len(stored)
+        flushed = [activity for activity in pending if int(activity["id"]) > written]
+        for activity in flushed:
+            tx.insert(ACTIVITIES_FILE, activity)
+        
+        def flushed_out():
+            activity_backlog.clear()
+            for activity in flushed:
+                trending_datasets.record(activity["dataset_id"], activity["type"], activity["timestamp"])
+        tx.after_commit(flushed_out)
+    return len(flushed)
+
+def iter_activities() -> Iterator[Dict[str, Any]]:
+    # Storage (chronological) order: sorting would need the whole history in memory
+    return iter_json_file(ACTIVITIES_FILE)
+
 def get_activities(skip: int = 0, limit: int = 100) -> List[Activity]:
     activities = read_json_file(ACTIVITIES_FILE)
     
@@ -253,13 +1295,127 @@ def get_activities(skip: int = 0, limit: int = 100) -> List[Activity]:
     
     return [Activity(**activity) for activity in paginated_activities]
 
+def aggregate_activities(
+    group_by: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    types: Optional[List[str]] = None,
+    dataset_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+    limit: Optional[int] = None
+) -> ActivityAggregate:
+    total, groups = activity_columns.ensure().aggregate(
+        group_by, limit, start=start, end=end, types=types, dataset_id=dataset_id, user_id=user_id
+    )
+    return ActivityAggregate(
+        group_by=group_by,
+        total=total,
+        groups=[ActivityGroup(key=key, count=count) for key, count in groups]
+    )
+
+# Change feed
+# Records are returned in their API form, so users lose hashed_password
+CHANGE_MODELS = {
+    "users": User,
+    "datasets": Dataset,
+    "access_requests": AccessRequest,
+    "activities": Activity,
+}
+
+def get_changes(since: int, collections: Optional[List[str]] = None, limit: int = 1000) -> ChangeFeed:
+    entries, position = change_log.since(since, collections, limit)
+    return ChangeFeed(
+        changes=[
+            Change(
+                seq=entry["seq"],
+                collection=entry["collection"],
+                id=entry["id"],
+                record=CHANGE_MODELS[entry["collection"]](**entry["record"]).dict()
+            )
+            for entry in entries
+        ],
+        last_seq=position
+    )
+
+async def wait_for_changes(since: int, timeout: float):
+    await change_log.wait(since, timeout)
+
+# Worker processes
+# Under serve.py each worker has its own indexes. Commits by other workers
+# reach them through the change log: the entries are applied with the
+# indexes' committed() hook, which only takes them if the index matches the
+# file as it was just before that commit; otherwise the index is left stale
+# and rebuilt from disk on its next use, as for any outside write.
+def sync_remote_changes() -> int:
+    with storage_lock:
+        entries, missed = change_log.sync()
+        if missed:
+            for index in COLLECTION_INDEXES.values():
+                index.invalidate()
+        # Consecutive entries from one commit to one collection share stamps
+        batches: List[Tuple[str, Any, List[Dict[str, Any]]]] = []
+        for entry in entries:
+            if batches and batches[-1][:2] == (entry["collection"], entry.get("stamps")):
+                batches[-1][2].append(entry["record"])
+            else:
+                batches.append((entry["collection"], entry.get("stamps"), [entry["record"]]))
+            # Views counted by the worker that flushed them
+            if entry.get("views"):
+                trending_datasets.record(entry["id"], "dataset_viewed", entry["viewed_at"], entry["views"])
+        for collection, stamps, records in batches:
+            # Entries replayed from a journal have no stamps
+            if stamps is not None:
+                old_stamp, new_stamp = (tuple(stamp) if stamp is not None else None for stamp in stamps)
+                COLLECTION_INDEXES[COLLECTION_FILES[collection]].committed(records, old_stamp, new_stamp)
+            if collection == "activities":
+                for activity in records:
+                    trending_datasets.record(activity["dataset_id"], activity["type"], activity["timestamp"])
+    return len(entries)
+
+def preload():
+    # Build every in-memory index up front; serve.py calls this before
+    # forking so the workers start with them in shared memory. Holding the
+    # write lock keeps the change log position in step with the files read.
+    with storage_lock, write_lock:
+        change_log.sync()
+        for index in COLLECTION_INDEXES.values():
+            index.ensure()
+        refresh_dataset_similarity()
+        load_trending_datasets()
+
+# Trending datasets
+# Sliding-window counts are fed by flush_activity_backlog and
+# record_dataset_view; the activity history is replayed once at startup, never
+# per request. Under serve.py, other workers' activities (once per backlog
+# flush) and views (once per counter flush) are picked up from the change log
+# by sync_remote_changes.
+trending_datasets = TrendingTracker()
+trending_loaded = threading.Event()
+
+def load_trending_datasets():
+    # Once per process; workers started by serve.py inherit it from preload()
+    if trending_loaded.is_set():
+        return
+    for activity in read_json_file(ACTIVITIES_FILE):
+        trending_datasets.record(activity["dataset_id"], activity["type"], activity["timestamp"])
+    trending_loaded.set()
+
+def get_trending_datasets(window: str = "day", limit: int = 10) -> List[Tuple[Dataset, float]]:
+    leaders = trending_datasets.top(window, limit)
+    if not leaders:
+        return []
+    
+    datasets = get_datasets_by_ids([dataset_id for dataset_id, _ in leaders])
+    return [(dataset, score) for dataset, (_, score) in zip(datasets, leaders) if dataset is not None]
+
 # Dataset statistics and metadata operations
-def get_dataset_stats(dataset_id: str) -> DatasetStats:
+def get_dataset_stats(dataset_id: str, dataset: Optional[Dataset] = None) -> DatasetStats:
     # In a real application, this would fetch actual statistics from the database
     # For this demo, we'll generate mock statistics
     
-    # Get the dataset to use its properties
-    dataset = get_dataset(dataset_id)
+    # Get the dataset to use its properties, unless the caller already has it
+    if dataset is None:
+        dataset = get_dataset(dataset_id)
     
     # Generate mock statistics based on the dataset
     total_participants = random.randint(500, 2000)
@@ -345,15 +1501,21 @@ def get_dataset_stats(dataset_id: str) -> DatasetStats:
         missing_data_percentage=missing_data_percentage
     )
 
-def get_dataset_metadata(dataset_id: str) -> DatasetMetadata:
+def get_dataset_metadata(
+    dataset_id: str,
+    dataset: Optional[Dataset] = None,
+    stats: Optional[DatasetStats] = None
+) -> DatasetMetadata:
     # In a real application, this would fetch actual metadata from the database
     # For this demo, we'll generate mock metadata
     
-    # Get the dataset to use its properties
-    dataset = get_dataset(dataset_id)
+    # Get the dataset to use its properties, unless the caller already has it
+    if dataset is None:
+        dataset = get_dataset(dataset_id)
     
     # Get the statistics (reuse some of the data)
-    stats = get_dataset_stats(dataset_id)
+    if stats is None:
+        stats = get_dataset_stats(dataset_id, dataset)
     
     # Generate additional metadata based on the dataset type
     imaging = None
@@ -409,3 +1571,24 @@ def get_dataset_metadata(dataset_id: str) -> DatasetMetadata:
         citation_text=citation_text,
         citation_count=citation_count
     )
+
+def get_dataset_detail(dataset_id: str, user: Optional[User] = None) -> Optional[DatasetDetail]:
+    # Everything the dataset page shows, from one lookup and one stats computation
+    dataset = get_dataset(dataset_id)
+    if dataset is None:
+        return None
+    
+    stats = get_dataset_stats(dataset_id, dataset)
+    detail = DatasetDetail(
+        dataset=dataset,
+        stats=stats,
+        metadata=get_dataset_metadata(dataset_id, dataset, stats)
+    )
+    if user is not None:
+        records = access_request_index.ensure().records
+        own = access_requests_by_user.get(user.id) & access_requests_by_dataset.get(dataset_id)
+        if own:
+            latest = max(own, key=lambda request_id: (to_epoch(records[request_id]["created_at"]), access_request_index.position[request_id]))
+            detail.access_request = AccessRequest(**records[latest])
+        detail.has_access = active_grant(grants_by_user_dataset.get((user.id, dataset_id)), time.time()) is not None
+    return detail
@@ -0,0 +1,53 @@
+from typing import Any, Dict, Iterable, Iterator, List
+import csv
+import io
+import json
+
+# Streaming NDJSON/CSV serialization for the export endpoints.
+# Rows are encoded as they come out of storage and grouped into chunks of
+# about CHUNK_BYTES, so memory stays flat regardless of how many rows there are.
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+CHUNK_BYTES = 64 * 1024
+
+def _csv_value(value: Any) -> Any:
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    return value
+
+def ndjson_lines(rows: Iterable[Dict[str, Any]], fields: List[str]) -> Iterator[str]:
+    for row in rows:
+        yield json.dumps({field: row.get(field) for field in fields}, default=str) + "\n"
+
+def csv_lines(rows: Iterable[Dict[str, Any]], fields: List[str]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for row in rows:
+        writer.writerow([_csv_value(row.get(field)) for field in fields])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # The header alone when there are no rows
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def stream_export(rows: Iterable[Dict[str, Any]], fields: List[str], fmt: str) -> Iterator[bytes]:
+    lines = csv_lines(rows, fields) if fmt == "csv" else ndjson_lines(rows, fields)
+    chunk = []
+    size = 0
+    for line in lines:
+        chunk.append(line)
+        size += len(line)
+        if size >= CHUNK_BYTES:
+            yield "".join(chunk).encode("utf-8")
+            chunk = []
+            size = 0
+    if chunk:
+        yield "".join(chunk).encode("utf-8")
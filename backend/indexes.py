@@ -0,0 +1,718 @@
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Set, Tuple
+from bisect import bisect_left, bisect_right, insort
+from itertools import groupby, repeat
+from operator import itemgetter
+import heapq
+import os
+import re
+import threading
+
+# In-memory indexes over the JSON collections.
+# A CollectionIndex holds the parsed records of one collection file plus any
+# number of secondary indexes. It is rebuilt when the file changes on disk
+# (detected by its stat stamp) and updated incrementally when this process
+# writes the file through database.write_json_file.
+
+Stamp = Tuple[int, int, int]
+
+# ordered() sorts a subset directly when it holds less than 1/SUBSET_SORT_RATIO
+# of the collection, and otherwise filters the maintained order
+SUBSET_SORT_RATIO = 8
+
+def file_stamp(file_path: str) -> Optional[Stamp]:
+    try:
+        st = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+class SecondaryIndex:
+    def attach(self, collection: "CollectionIndex"):
+        # Called once by CollectionIndex.add_index
+        pass
+
+    def clear(self):
+        raise NotImplementedError
+
+    def add(self, record_id: str, record: Dict[str, Any]):
+        raise NotImplementedError
+
+    def remove(self, record_id: str, record: Dict[str, Any]):
+        raise NotImplementedError
+
+    def rebuild(self, records: Dict[str, Dict[str, Any]]):
+        self.clear()
+        for record_id, record in records.items():
+            self.add(record_id, record)
+
+class HashIndex(SecondaryIndex):
+    """Exact-match lookups: value -> ids."""
+
+    def __init__(self, key: Callable[[Dict[str, Any]], Optional[Hashable]]):
+        self.key = key
+        self._ids: Dict[Hashable, Set[str]] = {}
+
+    def clear(self):
+        self._ids.clear()
+
+    def add(self, record_id, record):
+        value = self.key(record)
+        if value is not None:
+            self._ids.setdefault(value, set()).add(record_id)
+
+    def remove(self, record_id, record):
+        value = self.key(record)
+        ids = self._ids.get(value)
+        if ids is not None:
+            ids.discard(record_id)
+            if not ids:
+                del self._ids[value]
+
+    def get(self, value: Hashable) -> Set[str]:
+        return self._ids.get(value, set())
+
+    def values(self) -> Iterable[Hashable]:
+        return self._ids.keys()
+
+class SortedIndex(SecondaryIndex):
+    """Ids ordered by key, for range queries in O(log n + k) and ordered scans.
+
+    Records whose key is None are kept aside in `missing`; range queries skip
+    them and ordered scans put them last. Equal keys are ordered by storage
+    position, so incremental updates leave the order a rebuild would give.
+    """
+
+    def __init__(self, key: Callable[[Dict[str, Any]], Any]):
+        self.key = key
+        self._keys: List[Any] = []
+        # Storage position of each entry, ascending within a run of equal keys
+        self._positions: List[int] = []
+        self._ids: List[str] = []
+        self.missing: Set[str] = set()
+        self._collection: Optional["CollectionIndex"] = None
+
+    def attach(self, collection: "CollectionIndex"):
+        self._collection = collection
+
+    def _position(self, record_id: str) -> int:
+        return self._collection.position[record_id]
+
+    def __len__(self):
+        return len(self._ids)
+
+    def clear(self):
+        self._keys = []
+        self._positions = []
+        self._ids = []
+        self.missing = set()
+
+    def _slot(self, value: Any, position: int) -> int:
+        # Index of (value, position) among the entries
+        start = bisect_left(self._keys, value)
+        end = bisect_right(self._keys, value, start)
+        return bisect_left(self._positions, position, start, end)
+
+    def add(self, record_id, record):
+        value = self.key(record)
+        if value is None:
+            self.missing.add(record_id)
+            return
+        position = self._position(record_id)
+        i = self._slot(value, position)
+        self._keys.insert(i, value)
+        self._positions.insert(i, position)
+        self._ids.insert(i, record_id)
+
+    def remove(self, record_id, record):
+        value = self.key(record)
+        if value is None:
+            self.missing.discard(record_id)
+            return
+        i = self._slot(value, self._position(record_id))
+        if i < len(self._ids) and self._ids[i] == record_id:
+            del self._keys[i]
+            del self._positions[i]
+            del self._ids[i]
+
+    def _bounds(self, low: Any = None, high: Any = None) -> Tuple[int, int]:
+        start = 0 if low is None else bisect_left(self._keys, low)
+        end = len(self._keys) if high is None else bisect_right(self._keys, high)
+        return start, max(start, end)
+
+    def count(self, low: Any = None, high: Any = None) -> int:
+        start, end = self._bounds(low, high)
+        return end - start
+
+    def range(self, low: Any = None, high: Any = None) -> List[str]:
+        """Ids with low <= key <= high (either bound may be None), in key order."""
+        start, end = self._bounds(low, high)
+        return self._ids[start:end]
+
+    def ids(self, reverse: bool = False) -> Iterator[str]:
+        return reversed(self._ids) if reverse else iter(self._ids)
+
+    def rebuild(self, records: Dict[str, Dict[str, Any]]):
+        # Bulk load: one sort instead of n insertions; records come in
+        # storage order, which the stable sort keeps for equal keys
+        entries = []
+        self.missing = set()
+        for record_id, record in records.items():
+            value = self.key(record)
+            if value is None:
+                self.missing.add(record_id)
+            else:
+                entries.append((value, self._position(record_id), record_id))
+        entries.sort(key=itemgetter(0))
+        self._keys = [value for value, _, _ in entries]
+        self._positions = [position for _, position, _ in entries]
+        self._ids = [record_id for _, _, record_id in entries]
+
+WORD = re.compile(r"\w+")
+
+def trigrams(word: str) -> Set[str]:
+    # Padded so short words and word boundaries still produce grams
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class TrigramIndex(SecondaryIndex):
+    """Typo-tolerant word matching by character-trigram similarity.
+
+    Grams are indexed per distinct word rather than per record, so a query
+    term is compared against the vocabulary (which grows far slower than
+    the collection) and then expanded to records through the word postings.
+    """
+
+    def __init__(self, text: Callable[[Dict[str, Any]], str]):
+        self.text = text
+        self._words: Dict[str, Set[str]] = {}
+        self._grams: Dict[str, Set[str]] = {}
+        self._gram_counts: Dict[str, int] = {}
+        self._collection: Optional["CollectionIndex"] = None
+
+    def attach(self, collection: "CollectionIndex"):
+        # Equal scores are ranked by storage position
+        self._collection = collection
+
+    def _record_words(self, record) -> Set[str]:
+        return set(WORD.findall(self.text(record).casefold()))
+
+    def clear(self):
+        self._words.clear()
+        self._grams.clear()
+        self._gram_counts.clear()
+
+    def add(self, record_id, record):
+        for word in self._record_words(record):
+            ids = self._words.get(word)
+            if ids is None:
+                ids = self._words[word] = set()
+                grams = trigrams(word)
+                self._gram_counts[word] = len(grams)
+                for gram in grams:
+                    self._grams.setdefault(gram, set()).add(word)
+            ids.add(record_id)
+
+    def remove(self, record_id, record):
+        for word in self._record_words(record):
+            ids = self._words.get(word)
+            if ids is None:
+                continue
+            ids.discard(record_id)
+            if not ids:
+                del self._words[word]
+                del self._gram_counts[word]
+                for gram in trigrams(word):
+                    words = self._grams[gram]
+                    words.discard(word)
+                    if not words:
+                        del self._grams[gram]
+
+    def similar_words(self, term: str, threshold: float) -> Dict[str, float]:
+        """Vocabulary words whose trigram Jaccard similarity to term is >= threshold."""
+        grams = trigrams(term)
+        shared: Dict[str, int] = {}
+        for gram in grams:
+            for word in self._grams.get(gram, ()):
+                shared[word] = shared.get(word, 0) + 1
+        similar = {}
+        for word, count in shared.items():
+            score = count / (len(grams) + self._gram_counts[word] - count)
+            if score >= threshold:
+                similar[word] = score
+        return similar
+
+    def _ranked_words(self, term: str, threshold: float) -> List[Tuple[str, float]]:
+        return sorted(self.similar_words(term, threshold).items(), key=itemgetter(1), reverse=True)
+
+    def search(self, query: str, threshold: float = 0.4) -> List[Tuple[str, float]]:
+        """(id, score) pairs, best first, for records matching every query term.
+
+        A record's score is the mean over terms of its best word similarity;
+        equal scores come in storage order.
+        """
+        terms = set(WORD.findall(query.casefold()))
+        if len(terms) == 1:
+            # Each record at the score of its best word; words come best first
+            results: List[Tuple[str, float]] = []
+            seen: Set[str] = set()
+            for score, words in groupby(self._ranked_words(terms.pop(), threshold), key=itemgetter(1)):
+                ids = set().union(*(self._words[word] for word, _ in words)) - seen
+                results.extend(zip(self._in_storage_order(ids), repeat(score)))
+                seen |= ids
+            return results
+        scores: Optional[Dict[str, float]] = None
+        for term in terms:
+            # Best word per record: take words best first and only add records
+            # not seen yet (set and dict operations, not a per-record loop)
+            best: Dict[str, float] = {}
+            for word, score in self._ranked_words(term, threshold):
+                best.update(dict.fromkeys(self._words[word].difference(best), score))
+            if scores is None:
+                scores = best
+            else:
+                scores = {record_id: scores[record_id] + best[record_id] for record_id in scores.keys() & best.keys()}
+            if not scores:
+                return []
+        if scores is None:
+            return []
+        return [(record_id, total / len(terms)) for record_id, total in self._ranked(scores)]
+
+    def _in_storage_order(self, record_ids: Iterable[str]) -> List[str]:
+        return sorted(record_ids, key=self._collection.position.__getitem__)
+
+    def _ranked(self, scores: Dict[str, float]) -> List[Tuple[str, float]]:
+        by_score: Dict[float, List[str]] = {}
+        for record_id, score in scores.items():
+            by_score.setdefault(score, []).append(record_id)
+        return [
+            (record_id, score)
+            for score in sorted(by_score, reverse=True)
+            for record_id in self._in_storage_order(by_score[score])
+        ]
+
+class SubstringIndex(SecondaryIndex):
+    """Candidates for case-insensitive substring search.
+
+    If a query occurs in a record's text, each of the query's words occurs
+    inside one of the record's words. Words are looked up in the vocabulary
+    (through its trigrams for words of three or more characters), so the
+    candidate set costs no scan of the collection; callers still check the
+    substring on each candidate.
+    """
+
+    def __init__(self, text: Callable[[Dict[str, Any]], str]):
+        self.text = text
+        self._words: Dict[str, Set[str]] = {}
+        # Trigram -> vocabulary words containing it
+        self._grams: Dict[str, Set[str]] = {}
+
+    def _record_words(self, record) -> Set[str]:
+        return set(WORD.findall(self.text(record).lower()))
+
+    @staticmethod
+    def _grams_of(word: str) -> Set[str]:
+        return {word[i:i + 3] for i in range(len(word) - 2)}
+
+    def clear(self):
+        self._words.clear()
+        self._grams.clear()
+
+    def add(self, record_id, record):
+        for word in self._record_words(record):
+            ids = self._words.get(word)
+            if ids is None:
+                ids = self._words[word] = set()
+                for gram in self._grams_of(word):
+                    self._grams.setdefault(gram, set()).add(word)
+            ids.add(record_id)
+
+    def remove(self, record_id, record):
+        for word in self._record_words(record):
+            ids = self._words.get(word)
+            if ids is None:
+                continue
+            ids.discard(record_id)
+            if not ids:
+                del self._words[word]
+                for gram in self._grams_of(word):
+                    words = self._grams[gram]
+                    words.discard(word)
+                    if not words:
+                        del self._grams[gram]
+
+    def words_containing(self, part: str) -> List[str]:
+        grams = self._grams_of(part)
+        if not grams:
+            # Shorter than a trigram: check the vocabulary
+            return [word for word in self._words if part in word]
+        postings = sorted((self._grams.get(gram, set()) for gram in grams), key=len)
+        return [word for word in postings[0].intersection(*postings[1:]) if part in word]
+
+    def candidates(self, query: str) -> Optional[Set[str]]:
+        """Ids that may contain query; None if it has no words to look up.
+
+        A superset is enough, so query words that would narrow the result
+        little are skipped: short ones when longer ones exist, and ones with
+        many more postings than the result so far.
+        """
+        parts = set(WORD.findall(query.lower()))
+        if not parts:
+            return None
+        if any(len(part) >= 3 for part in parts):
+            parts = {part for part in parts if len(part) >= 3}
+        lookups = []
+        for part in parts:
+            words = self.words_containing(part)
+            lookups.append((sum(len(self._words[word]) for word in words), words))
+        lookups.sort(key=itemgetter(0))
+        result: Optional[Set[str]] = None
+        for size, words in lookups:
+            if result is not None and size > 4 * len(result):
+                break
+            ids = set().union(*(self._words[word] for word in words))
+            result = ids if result is None else result & ids
+            if not result:
+                break
+        return result
+
+class PrefixIndex(SecondaryIndex):
+    """Word-prefix search: ids whose text has, for every query word, a word
+    starting with it ("ann smi" finds "Anna Smith")."""
+
+    def __init__(self, text: Callable[[Dict[str, Any]], str]):
+        self.text = text
+        self._ids: Dict[str, Set[str]] = {}
+        # The distinct words, sorted so a prefix is a contiguous range
+        self._sorted: List[str] = []
+
+    def _words(self, record) -> Set[str]:
+        return set(WORD.findall(self.text(record).casefold()))
+
+    def clear(self):
+        self._ids = {}
+        self._sorted = []
+
+    def add(self, record_id, record):
+        for word in self._words(record):
+            ids = self._ids.get(word)
+            if ids is None:
+                ids = self._ids[word] = set()
+                insort(self._sorted, word)
+            ids.add(record_id)
+
+    def remove(self, record_id, record):
+        for word in self._words(record):
+            ids = self._ids.get(word)
+            if ids is None:
+                continue
+            ids.discard(record_id)
+            if not ids:
+                del self._ids[word]
+                del self._sorted[bisect_left(self._sorted, word)]
+
+    def rebuild(self, records):
+        self.clear()
+        for record_id, record in records.items():
+            for word in self._words(record):
+                self._ids.setdefault(word, set()).add(record_id)
+        self._sorted = sorted(self._ids)
+
+    def _prefixed(self, prefix: str) -> Set[str]:
+        ids: Set[str] = set()
+        for i in range(bisect_left(self._sorted, prefix), len(self._sorted)):
+            word = self._sorted[i]
+            if not word.startswith(prefix):
+                break
+            ids |= self._ids[word]
+        return ids
+
+    def search(self, query: str) -> Optional[Set[str]]:
+        """Matching ids, or None if the query has no words."""
+        terms = WORD.findall(query.casefold())
+        if not terms:
+            return None
+        # Longest terms first: they usually match the fewest words
+        terms.sort(key=len, reverse=True)
+        ids = self._prefixed(terms[0])
+        for term in terms[1:]:
+            if not ids:
+                break
+            ids &= self._prefixed(term)
+        return ids
+
+class SuggestIndex(SecondaryIndex):
+    """Prefix completion over short phrases, ranked by popularity.
+
+    phrases(record) yields (field, phrase) pairs. Each distinct phrase is
+    one entry carrying the number of records that have it and the sum of
+    their weights; its keys (the phrase from each word start on, casefolded)
+    live in one sorted array, so a prefix is a bisected slice of it.
+    """
+
+    MAX_CACHED = 1024
+
+    def __init__(
+        self,
+        phrases: Callable[[Dict[str, Any]], Iterable[Tuple[str, str]]],
+        weight: Callable[[Dict[str, Any]], int],
+    ):
+        self.phrases = phrases
+        self.weight = weight
+        # (folded phrase, field) -> [phrase, record count, total weight]
+        self._entries: Dict[Tuple[str, str], List[Any]] = {}
+        # Sorted (key, folded phrase, field)
+        self._keys: List[Tuple[str, str, str]] = []
+        # Answers by (prefix, limit), dropped on any change
+        self._cache: Dict[Tuple[str, int], List[Tuple[str, str, int]]] = {}
+
+    @staticmethod
+    def _phrase_keys(folded: str, field: str) -> List[Tuple[str, str, str]]:
+        return [(folded[match.start():], folded, field) for match in WORD.finditer(folded)]
+
+    def _record_phrases(self, record) -> Set[Tuple[str, str]]:
+        return {(field, phrase.strip()) for field, phrase in self.phrases(record) if phrase and phrase.strip()}
+
+    def clear(self):
+        self._entries = {}
+        self._keys = []
+        self._cache = {}
+
+    def _add(self, record, new_keys: Optional[List[Tuple[str, str, str]]]):
+        weight = self.weight(record)
+        for field, phrase in self._record_phrases(record):
+            entry_key = (phrase.casefold(), field)
+            entry = self._entries.get(entry_key)
+            if entry is None:
+                entry = self._entries[entry_key] = [phrase, 0, 0]
+                keys = self._phrase_keys(*entry_key)
+                if new_keys is None:
+                    for key in keys:
+                        self._keys.insert(bisect_left(self._keys, key), key)
+                else:
+                    new_keys.extend(keys)
+            entry[1] += 1
+            entry[2] += weight
+
+    def add(self, record_id, record):
+        self._add(record, None)
+        self._cache = {}
+
+    def remove(self, record_id, record):
+        weight = self.weight(record)
+        for field, phrase in self._record_phrases(record):
+            entry_key = (phrase.casefold(), field)
+            entry = self._entries.get(entry_key)
+            if entry is None:
+                continue
+            entry[1] -= 1
+            entry[2] -= weight
+            if entry[1] <= 0:
+                del self._entries[entry_key]
+                for key in self._phrase_keys(*entry_key):
+                    position = bisect_left(self._keys, key)
+                    if position < len(self._keys) and self._keys[position] == key:
+                        del self._keys[position]
+        self._cache = {}
+
+    def rebuild(self, records):
+        # Bulk load: one sort instead of an insertion per new phrase
+        self.clear()
+        keys: List[Tuple[str, str, str]] = []
+        for record in records.values():
+            self._add(record, keys)
+        keys.sort()
+        self._keys = keys
+
+    def suggest(self, prefix: str, limit: int = 10) -> List[Tuple[str, str, int]]:
+        """Up to limit (phrase, field, record count) completions of prefix, most popular first."""
+        prefix = " ".join(prefix.casefold().split())
+        if not prefix or limit <= 0:
+            return []
+        cached = self._cache.get((prefix, limit))
+        if cached is not None:
+            return cached
+        start = bisect_left(self._keys, (prefix,))
+        end = bisect_left(self._keys, (prefix + "\U0010ffff",), start)
+        # Sorted so equally popular phrases come alphabetically
+        entry_keys = sorted({(folded, field) for _, folded, field in self._keys[start:end]})
+        best = heapq.nlargest(limit, entry_keys, key=lambda entry_key: (self._entries[entry_key][2], self._entries[entry_key][1]))
+        result = [(self._entries[entry_key][0], entry_key[1], self._entries[entry_key][1]) for entry_key in best]
+        if len(self._cache) >= self.MAX_CACHED:
+            self._cache = {}
+        self._cache[(prefix, limit)] = result
+        return result
+
+class DeadlineIndex(SecondaryIndex):
+    """Min-heap of (deadline, id) for records whose key gives a deadline.
+
+    Changed or removed records leave their old heap entry behind; it is
+    recognised as stale against the current deadline and skipped on pop.
+    """
+
+    def __init__(self, key: Callable[[Dict[str, Any]], Optional[float]]):
+        self.key = key
+        self._heap: List[Tuple[float, str]] = []
+        self._deadline: Dict[str, float] = {}
+
+    def clear(self):
+        self._heap = []
+        self._deadline = {}
+
+    def add(self, record_id, record):
+        deadline = self.key(record)
+        if deadline is None or self._deadline.get(record_id) == deadline:
+            return
+        self._deadline[record_id] = deadline
+        heapq.heappush(self._heap, (deadline, record_id))
+
+    def remove(self, record_id, record):
+        self._deadline.pop(record_id, None)
+
+    def rebuild(self, records):
+        self._deadline = {}
+        for record_id, record in records.items():
+            deadline = self.key(record)
+            if deadline is not None:
+                self._deadline[record_id] = deadline
+        self._heap = [(deadline, record_id) for record_id, deadline in self._deadline.items()]
+        heapq.heapify(self._heap)
+
+    def _drop_stale(self):
+        while self._heap and self._deadline.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def next_deadline(self) -> Optional[float]:
+        self._drop_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: float) -> List[str]:
+        """Remove and return the ids whose deadline is <= now, earliest first."""
+        due = []
+        self._drop_stale()
+        while self._heap and self._heap[0][0] <= now:
+            deadline, record_id = heapq.heappop(self._heap)
+            del self._deadline[record_id]
+            due.append(record_id)
+            self._drop_stale()
+        return due
+
+    def restore(self, records: Iterable[Tuple[str, Dict[str, Any]]]):
+        # Put back records from pop_due whose transition could not be applied
+        for record_id, record in records:
+            self.add(record_id, record)
+
+class CollectionIndex:
+    def __init__(
+        self,
+        file_path: str,
+        load: Callable[[str], List[Dict[str, Any]]],
+        prepare: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
+    ):
+        self.file_path = file_path
+        self._load = load
+        self._prepare = prepare
+        self.records: Dict[str, Dict[str, Any]] = {}
+        # Insertion sequence of each id, to restore storage order for subsets
+        self.position: Dict[str, int] = {}
+        self.secondary: List[SecondaryIndex] = []
+        # Bumped on every change, so derived caches can tell they are stale
+        self.generation = 0
+        self._stamp: Optional[Stamp] = None
+        self._next_position = 0
+        # Held by ensure(), rebuild() and committed(), and by writers from
+        # just before they replace the file until committed() has applied
+        # the write (see database.write_json_file), so a read in between
+        # waits for the commit instead of finding a new stamp and rebuilding
+        self.lock = threading.RLock()
+
+    def add_index(self, index: SecondaryIndex) -> SecondaryIndex:
+        with self.lock:
+            index.attach(self)
+            self.secondary.append(index)
+            if self._stamp is not None:
+                for record_id, record in self.records.items():
+                    index.add(record_id, record)
+        return index
+
+    def ensure(self) -> "CollectionIndex":
+        """Make sure the index reflects the file on disk; a stat when it already does."""
+        with self.lock:
+            stamp = file_stamp(self.file_path)
+            if self._stamp is None or stamp != self._stamp:
+                self.rebuild(self._load(self.file_path), stamp)
+        return self
+
+    def invalidate(self):
+        with self.lock:
+            self._stamp = None
+
+    def rebuild(self, rows: List[Dict[str, Any]], stamp: Optional[Stamp]):
+        with self.lock:
+            if self._prepare is not None:
+                rows = [self._prepare(row) for row in rows]
+            self.records = {row["id"]: row for row in rows}
+            self.position = {record_id: i for i, record_id in enumerate(self.records)}
+            self._next_position = len(self.position)
+            for index in self.secondary:
+                index.rebuild(self.records)
+            self._stamp = stamp
+            self.generation += 1
+
+    def _upsert(self, record: Dict[str, Any]):
+        if self._prepare is not None:
+            record = self._prepare(record)
+        record_id = record["id"]
+        old = self.records.get(record_id)
+        if old is not None:
+            for index in self.secondary:
+                index.remove(record_id, old)
+        else:
+            self.position[record_id] = self._next_position
+            self._next_position += 1
+        self.records[record_id] = record
+        for index in self.secondary:
+            index.add(record_id, record)
+
+    def committed(self, changed: Iterable[Dict[str, Any]], old_stamp: Optional[Stamp], new_stamp: Optional[Stamp]):
+        """Apply records this process just wrote to the file.
+
+        Only valid if the index matched the file before the write; otherwise it
+        stays stale and the next ensure() rebuilds it from disk.
+        """
+        with self.lock:
+            if self._stamp is None or self._stamp != old_stamp:
+                return
+            for record in changed:
+                self._upsert(record)
+            self._stamp = new_stamp
+            self.generation += 1
+
+    def in_storage_order(self, record_ids: Iterable[str]) -> List[str]:
+        return sorted(record_ids, key=self.position.__getitem__)
+
+    def ordered(self, index: SortedIndex, reverse: bool = False, subset: Optional[Set[str]] = None) -> Iterator[str]:
+        """Ids in the order of a sorted index, optionally limited to subset.
+
+        Equal keys keep storage order (reversed when descending); records
+        without a key come last, in storage order.
+        """
+        if subset is None:
+            yield from index.ids(reverse)
+            yield from self.in_storage_order(index.missing)
+            return
+        if len(subset) * SUBSET_SORT_RATIO < len(self.records):
+            # A small subset: sorting it is cheaper than walking the whole order
+            keyed = []
+            missing = []
+            for record_id in subset:
+                value = index.key(self.records[record_id])
+                if value is None:
+                    missing.append(record_id)
+                else:
+                    keyed.append((value, self.position[record_id], record_id))
+            keyed.sort(key=lambda item: item[:2], reverse=reverse)
+            yield from (record_id for _, _, record_id in keyed)
+            yield from self.in_storage_order(missing)
+            return
+        yield from (record_id for record_id in index.ids(reverse) if record_id in subset)
+        yield from self.in_storage_order(index.missing & subset)
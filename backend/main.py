@@ -1,27 +1,55 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Query, status, File, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from fastapi.encoders import jsonable_encoder
+from starlette.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel, Field, EmailStr
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
+import asyncio
+import io
 import jwt
 import uuid
 import os
 from passlib.context import CryptContext
 from models import (
+    BatchGet,
     User, UserCreate, UserInDB, UserUpdate, Token, TokenData,
-    Dataset, DatasetCreate, DatasetInDB, DatasetUpdate,
+    Dataset, DatasetCreate, DatasetInDB, DatasetUpdate, TrendingDataset, DatasetSuggestion, SimilarDataset,
     AccessRequest, AccessRequestCreate, AccessRequestInDB, AccessRequestUpdate,
-    Activity, ActivityCreate, ActivityInDB,
-    DatasetStats, DatasetMetadata
+    AccessRequestBatchDecision, AccessRequestDecisionOutcome,
+    Activity, ActivityCreate, ActivityInDB, ActivityAggregate,
+    DatasetStats, DatasetMetadata, DatasetDetail, ImportSummary,
+    Entitlement, EntitlementCheck, ChangeFeed
 )
 from database import (
-    get_user, create_user, update_user, get_users,
-    get_dataset, create_dataset, update_dataset, get_datasets,
+    get_user, create_user, update_user, get_users, get_users_by_ids,
+    get_dataset, create_dataset, update_dataset, get_datasets, get_datasets_by_ids, datasets_generation,
     get_access_request, create_access_request, update_access_request, get_access_requests,
-    create_activity, get_activities,
-    get_dataset_stats, get_dataset_metadata
+    create_activities, get_activities, aggregate_activities, ACTIVITY_GROUPINGS,
+    flush_activity_backlog, pending_activities,
+    user_conflict, has_pending_access_request, access_request_status,
+    get_dataset_stats, get_dataset_metadata, get_dataset_detail,
+    record_dataset_view, record_dataset_grant, flush_dataset_counters,
+    load_trending_datasets, get_trending_datasets, suggest_datasets,
+    get_similar_datasets, refresh_dataset_similarity,
+    iter_datasets, iter_access_requests, iter_activities,
+    decide_access_requests, ACCESS_GRANT_DURATION,
+    get_entitlement, get_entitlements,
+    seconds_until_next_expiry, expire_access_requests,
+    parse_sort, USER_SORTS, DATASET_SORTS, ACCESS_REQUEST_SORTS,
+    get_changes, wait_for_changes, change_log, CHANGE_MODELS,
+    sync_remote_changes, worker_channel, transaction
 )
+from trending import TRENDING_WINDOWS
+from metrics import registry, MetricsMiddleware, PASSWORD_HASH_SECONDS
+from profiling import ProfilingMiddleware
+from bulk_import import IMPORT_FORMATS, detect_format, run_import
+from exports import EXPORT_FORMATS, stream_export
+from cache import QueryCache
+from changes import ChangesExpired
+from activity_log import ActivityWriter
 
 # Initialize FastAPI app
 app = FastAPI(title="Clinical Dataset Hub API")
@@ -35,20 +63,79 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-route latency, request/response sizes and in-flight requests
+app.add_middleware(MetricsMiddleware)
+
 # Security
 SECRET_KEY = os.getenv("SECRET_KEY", "development_secret_key")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# On-demand request profiling for admins (see profiling.py)
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+# Dataset view/grant counters are flushed to storage at this interval (seconds)
+COUNTER_FLUSH_INTERVAL = float(os.getenv("COUNTER_FLUSH_INTERVAL", "5"))
+
+# Dataset edits are folded into the similar-datasets matrix at this interval (seconds)
+SIMILARITY_REFRESH_INTERVAL = float(os.getenv("SIMILARITY_REFRESH_INTERVAL", "30"))
+
+# Activity log entries are committed to a backlog, which is flushed into the
+# log at this interval (seconds) or once ACTIVITY_BATCH_SIZE entries are
+# waiting; routes wait for a flush while ACTIVITY_QUEUE_SIZE entries are
+ACTIVITY_FLUSH_INTERVAL = float(os.getenv("ACTIVITY_FLUSH_INTERVAL", "1"))
+ACTIVITY_QUEUE_SIZE = int(os.getenv("ACTIVITY_QUEUE_SIZE", "10000"))
+ACTIVITY_BATCH_SIZE = int(os.getenv("ACTIVITY_BATCH_SIZE", "500"))
+
+# Grant expiry: the scheduler wakes at the next expiry_date plus this window,
+# so grants expiring close together are moved to "expired" in one write, and
+# at least every EXPIRY_CHECK_INTERVAL seconds. Entitlement checks compare
+# expiry_date directly, so the window never extends access.
+EXPIRY_BATCH_WINDOW = float(os.getenv("EXPIRY_BATCH_WINDOW", "30"))
+EXPIRY_CHECK_INTERVAL = float(os.getenv("EXPIRY_CHECK_INTERVAL", "300"))
+
+# Serialized /datasets/ responses: entries are dropped when the dataset
+# collection changes, and after QUERY_CACHE_TTL seconds so buffered view and
+# grant counts in them stay near-real-time
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "256"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "5"))
+
+# Upper bound on the number of ids accepted by batch endpoints
+MAX_BATCH_SIZE = 500
+
+# Upper bound on the number of completions returned by /datasets/suggest
+MAX_SUGGESTIONS = 50
+
+# Upper bound on the number of datasets returned by /datasets/{id}/similar
+MAX_SIMILAR_DATASETS = 50
+
+# Upper bound on the number of groups returned by /activities/aggregate
+MAX_ACTIVITY_GROUPS = 1000
+
+# Upper bounds on the changes returned by one /changes call, and on how long
+# it waits for new ones (seconds)
+MAX_CHANGES = 5000
+MAX_CHANGES_WAIT = 60
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+dataset_query_cache = QueryCache("datasets", QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+activity_writer = ActivityWriter(
+    create_activities, flush_activity_backlog, pending_activities, transaction,
+    ACTIVITY_QUEUE_SIZE, ACTIVITY_BATCH_SIZE, ACTIVITY_FLUSH_INTERVAL
+)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+# For endpoints that are public but tailor the response to a signed-in caller
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
 
 # Helper functions
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    with PASSWORD_HASH_SECONDS.time("verify"):
+        return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    with PASSWORD_HASH_SECONDS.time("hash"):
+        return pwd_context.hash(password)
 
 def authenticate_user(username: str, password: str):
     user = get_user(username)
@@ -87,6 +174,21 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         raise credentials_exception
     return user
 
+def is_admin_token(token: str) -> bool:
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except jwt.PyJWTError:
+        return False
+    user = get_user(username=payload.get("sub"))
+    return user is not None and user.is_active and user.is_admin
+
+async def get_optional_user(token: Optional[str] = Depends(optional_oauth2_scheme)) -> Optional[User]:
+    # None for anonymous callers; an invalid token is still an error
+    if token is None:
+        return None
+    user = await get_current_user(token)
+    return user if user.is_active else None
+
 async def get_current_active_user(current_user: User = Depends(get_current_user)):
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
@@ -100,6 +202,89 @@ async def get_current_admin_user(current_user: User = Depends(get_current_active
         )
     return current_user
 
+if PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware, directory=PROFILE_DIR, is_admin=is_admin_token)
+
+def check_batch_size(ids: List[str]):
+    if len(ids) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_SIZE} ids per batch")
+
+def check_sort(sort: Optional[str], sorts) -> Optional[str]:
+    if sort and parse_sort(sort)[0] not in sorts:
+        raise HTTPException(status_code=400, detail=f"Unknown sort field, expected one of: {', '.join(sorts)} (prefix with - for descending)")
+    return sort
+
+def export_response(rows, fields: List[str], fmt: str, name: str) -> StreamingResponse:
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format, expected one of: {', '.join(EXPORT_FORMATS)}")
+    return StreamingResponse(
+        stream_export(rows, fields, fmt),
+        media_type=EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{fmt}"'}
+    )
+
+# Background tasks
+async def flush_counters_periodically():
+    while True:
+        await asyncio.sleep(COUNTER_FLUSH_INTERVAL)
+        try:
+            flush_dataset_counters()
+        except OSError:
+            # Increments are kept in the buffer and retried on the next tick
+            pass
+
+async def refresh_similarity_periodically():
+    while True:
+        await asyncio.sleep(SIMILARITY_REFRESH_INTERVAL)
+        # The rebuild is vectorised but can take a moment on a large catalog,
+        # so it runs off the event loop
+        await run_in_threadpool(refresh_dataset_similarity)
+
+async def expire_grants_on_schedule():
+    while True:
+        try:
+            # Catches up on grants that expired while the app was down
+            expire_access_requests()
+        except OSError:
+            # Due grants are put back and retried on the next tick
+            pass
+        delay = seconds_until_next_expiry()
+        if delay is None:
+            delay = EXPIRY_CHECK_INTERVAL
+        await asyncio.sleep(min(max(delay, 0) + EXPIRY_BATCH_WINDOW, EXPIRY_CHECK_INTERVAL))
+
+async def apply_remote_commits(pending: asyncio.Event):
+    # Under serve.py: fold other workers' commits into this worker's indexes
+    # (and wake its long polls) as soon as they are announced
+    while True:
+        await pending.wait()
+        pending.clear()
+        await run_in_threadpool(sync_remote_changes)
+
+@app.on_event("startup")
+async def start_background_tasks():
+    load_trending_datasets()
+    app.state.counter_flush_task = asyncio.create_task(flush_counters_periodically())
+    app.state.similarity_refresh_task = asyncio.create_task(refresh_similarity_periodically())
+    app.state.grant_expiry_task = asyncio.create_task(expire_grants_on_schedule())
+    activity_writer.start()
+    app.state.remote_commit_task = None
+    if worker_channel.enabled:
+        pending = asyncio.Event()
+        worker_channel.listen(pending.set)
+        app.state.remote_commit_task = asyncio.create_task(apply_remote_commits(pending))
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    app.state.counter_flush_task.cancel()
+    app.state.similarity_refresh_task.cancel()
+    app.state.grant_expiry_task.cancel()
+    flush_dataset_counters()
+    await activity_writer.stop()
+    if app.state.remote_commit_task is not None:
+        app.state.remote_commit_task.cancel()
+        worker_channel.close()
+
 # Routes
 @app.post("/token", response_model=Token)
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
@@ -124,10 +309,8 @@ async def register_user(user: UserCreate):
         raise HTTPException(status_code=400, detail="Username already registered")
     
     # Check if email exists
-    users = get_users()
-    for existing_user in users:
-        if existing_user.email == user.email:
-            raise HTTPException(status_code=400, detail="Email already registered")
+    if get_user(email=user.email):
+        raise HTTPException(status_code=400, detail="Email already registered")
     
     hashed_password = get_password_hash(user.password)
     user_in_db = UserInDB(
@@ -143,19 +326,24 @@ async def register_user(user: UserCreate):
         avatar_url=f"https://api.dicebear.com/7.x/avataaars/svg?seed={user.username}"
     )
     
-    created_user = create_user(user_in_db)
-    
-    # Log activity
+    # Commit the record and its activity together
     activity = ActivityCreate(
         type="user_registered",
         user_id=None,
-        target_id=created_user.id,
+        target_id=user_in_db.id,
         dataset_id=None,
-        description=f"User {created_user.username} registered"
+        description=f"User {user_in_db.username} registered"
     )
-    create_activity(activity)
-    
-    return created_user
+    def register(tx):
+        # Checked again under the transaction: another registration may have
+        # committed since the checks above
+        conflict = user_conflict(user_in_db.username, user_in_db.email, tx)
+        if conflict == "username":
+            raise HTTPException(status_code=400, detail="Username already registered")
+        if conflict == "email":
+            raise HTTPException(status_code=400, detail="Email already registered")
+        return create_user(user_in_db, tx=tx)
+    return await activity_writer.log(activity, register)
 
 @app.get("/users/me/", response_model=User)
 async def read_users_me(current_user: User = Depends(get_current_active_user)):
@@ -167,10 +355,53 @@ async def update_user_me(user_update: UserUpdate, current_user: User = Depends(g
     return updated_user
 
 @app.get("/users/", response_model=List[User])
-async def read_users(skip: int = 0, limit: int = 100, current_user: User = Depends(get_current_admin_user)):
-    users = get_users(skip=skip, limit=limit)
+async def read_users(
+    skip: int = 0,
+    limit: int = 100,
+    search: Optional[str] = None,
+    institution: Optional[str] = None,
+    is_admin: Optional[bool] = None,
+    is_active: Optional[bool] = None,
+    sort: Optional[str] = None,
+    current_user: User = Depends(get_current_admin_user)
+):
+    users = get_users(
+        skip=skip,
+        limit=limit,
+        search=search,
+        institution=institution,
+        is_admin=is_admin,
+        is_active=is_active,
+        sort=check_sort(sort, USER_SORTS)
+    )
     return users
 
+@app.post("/users/batch", response_model=List[Optional[User]])
+async def read_users_batch(batch: BatchGet, current_user: User = Depends(get_current_admin_user)):
+    check_batch_size(batch.ids)
+    return get_users_by_ids(batch.ids)
+
+# Entitlements: admins can look up any user, users only themselves
+def check_entitlement_access(user_id: str, current_user: User):
+    if not current_user.is_admin and current_user.id != user_id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions")
+
+@app.get("/users/{user_id}/entitlements", response_model=List[Entitlement])
+async def read_user_entitlements(user_id: str, current_user: User = Depends(get_current_active_user)):
+    check_entitlement_access(user_id, current_user)
+    return get_entitlements(user_id)
+
+@app.get("/users/{user_id}/entitlements/{dataset_id}", response_model=EntitlementCheck)
+async def check_user_entitlement(user_id: str, dataset_id: str, current_user: User = Depends(get_current_active_user)):
+    check_entitlement_access(user_id, current_user)
+    entitlement = get_entitlement(user_id, dataset_id)
+    return {
+        "user_id": user_id,
+        "dataset_id": dataset_id,
+        "has_access": entitlement is not None,
+        "entitlement": entitlement
+    }
+
 # Dataset routes
 @app.post("/datasets/", response_model=Dataset)
 async def create_new_dataset(dataset: DatasetCreate, current_user: User = Depends(get_current_admin_user)):
@@ -196,30 +427,85 @@ async def create_new_dataset(dataset: DatasetCreate, current_user: User = Depend
         access_count=0
     )
     
-    created_dataset = create_dataset(dataset_in_db)
-    
-    # Log activity
+    # Commit the record and its activity together
     activity = ActivityCreate(
         type="dataset_uploaded",
         user_id=current_user.id,
         target_id=None,
-        dataset_id=created_dataset.id,
-        description=f"Dataset {created_dataset.name} uploaded by {current_user.username}"
+        dataset_id=dataset_in_db.id,
+        description=f"Dataset {dataset_in_db.name} uploaded by {current_user.username}"
     )
-    create_activity(activity)
-    
-    return created_dataset
+    return await activity_writer.log(activity, lambda tx: create_dataset(dataset_in_db, tx=tx))
 
 @app.get("/datasets/", response_model=List[Dataset])
-async def read_datasets(skip: int = 0, limit: int = 100, search: Optional[str] = None, data_type: Optional[str] = None):
-    datasets = get_datasets(skip=skip, limit=limit, search=search, data_type=data_type)
-    return datasets
+async def read_datasets(
+    skip: int = 0,
+    limit: int = 100,
+    search: Optional[str] = None,
+    data_type: Optional[str] = None,
+    min_sample_size: Optional[int] = None,
+    max_sample_size: Optional[int] = None,
+    collected_from: Optional[int] = None,
+    collected_to: Optional[int] = None,
+    sort: Optional[str] = None
+):
+    # Search is case-insensitive, so equivalent queries share a cache entry
+    search = search.lower() if search else None
+    sort = check_sort(sort, DATASET_SORTS) or None
+    key = (skip, limit, search, data_type or None, min_sample_size, max_sample_size, collected_from, collected_to, sort)
+    generation = datasets_generation()
+    body = dataset_query_cache.get(key, generation)
+    if body is None:
+        datasets = get_datasets(
+            skip=skip,
+            limit=limit,
+            search=search,
+            data_type=data_type,
+            min_sample_size=min_sample_size,
+            max_sample_size=max_sample_size,
+            collected_from=collected_from,
+            collected_to=collected_to,
+            sort=sort
+        )
+        body = JSONResponse(jsonable_encoder(datasets)).body
+        dataset_query_cache.put(key, generation, body)
+    return Response(content=body, media_type="application/json")
+
+@app.post("/datasets/batch", response_model=List[Optional[Dataset]])
+async def read_datasets_batch(batch: BatchGet):
+    check_batch_size(batch.ids)
+    return get_datasets_by_ids(batch.ids)
+
+@app.get("/datasets/export")
+async def export_datasets(
+    format: str = "ndjson",
+    search: Optional[str] = None,
+    data_type: Optional[str] = None,
+    current_user: User = Depends(get_current_admin_user)
+):
+    return export_response(iter_datasets(search=search, data_type=data_type), list(Dataset.__fields__), format, "datasets")
+
+@app.get("/datasets/trending", response_model=List[TrendingDataset])
+async def read_trending_datasets(window: str = "day", limit: int = 10):
+    if window not in TRENDING_WINDOWS:
+        raise HTTPException(status_code=400, detail=f"Unknown window, expected one of: {', '.join(TRENDING_WINDOWS)}")
+    if limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be at least 1")
+    
+    trending = get_trending_datasets(window=window, limit=limit)
+    return [{"dataset": dataset, "score": score} for dataset, score in trending]
+
+@app.get("/datasets/suggest", response_model=List[DatasetSuggestion])
+async def read_dataset_suggestions(prefix: str, limit: int = 10):
+    suggestions = suggest_datasets(prefix, min(limit, MAX_SUGGESTIONS))
+    return [{"text": text, "field": field, "dataset_count": count} for text, field, count in suggestions]
 
 @app.get("/datasets/{dataset_id}", response_model=Dataset)
 async def read_dataset(dataset_id: str):
     dataset = get_dataset(dataset_id)
     if dataset is None:
         raise HTTPException(status_code=404, detail="Dataset not found")
+    record_dataset_view(dataset_id)
     return dataset
 
 @app.put("/datasets/{dataset_id}", response_model=Dataset)
@@ -228,19 +514,15 @@ async def update_dataset_endpoint(dataset_id: str, dataset_update: DatasetUpdate
     if dataset is None:
         raise HTTPException(status_code=404, detail="Dataset not found")
     
-    updated_dataset = update_dataset(dataset_id, dataset_update)
-    
-    # Log activity
+    # Commit the change and its activity together
     activity = ActivityCreate(
         type="dataset_updated",
         user_id=current_user.id,
         target_id=None,
         dataset_id=dataset_id,
-        description=f"Dataset {updated_dataset.name} updated by {current_user.username}"
+        description=f"Dataset {dataset_update.name or dataset.name} updated by {current_user.username}"
     )
-    create_activity(activity)
-    
-    return updated_dataset
+    return await activity_writer.log(activity, lambda tx: update_dataset(dataset_id, dataset_update, tx=tx))
 
 @app.get("/datasets/{dataset_id}/stats", response_model=DatasetStats)
 async def read_dataset_stats(dataset_id: str):
@@ -248,18 +530,66 @@ async def read_dataset_stats(dataset_id: str):
     if dataset is None:
         raise HTTPException(status_code=404, detail="Dataset not found")
     
-    stats = get_dataset_stats(dataset_id)
+    stats = get_dataset_stats(dataset_id, dataset)
     return stats
 
+@app.get("/datasets/{dataset_id}/similar", response_model=List[SimilarDataset])
+async def read_similar_datasets(dataset_id: str, limit: int = 10):
+    similar = get_similar_datasets(dataset_id, min(limit, MAX_SIMILAR_DATASETS))
+    if similar is None:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    return [{"dataset": dataset, "score": score} for dataset, score in similar]
+
 @app.get("/datasets/{dataset_id}/metadata", response_model=DatasetMetadata)
 async def read_dataset_metadata(dataset_id: str):
     dataset = get_dataset(dataset_id)
     if dataset is None:
         raise HTTPException(status_code=404, detail="Dataset not found")
     
-    metadata = get_dataset_metadata(dataset_id)
+    metadata = get_dataset_metadata(dataset_id, dataset)
     return metadata
 
+@app.get("/datasets/{dataset_id}/full", response_model=DatasetDetail)
+async def read_dataset_detail(dataset_id: str, current_user: Optional[User] = Depends(get_optional_user)):
+    detail = get_dataset_detail(dataset_id, current_user)
+    if detail is None:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    record_dataset_view(dataset_id)
+    return detail
+
+# Bulk import routes (admin only)
+async def import_upload(kind: str, file: UploadFile, format: Optional[str], skip_invalid: bool, dry_run: bool, owner: User):
+    fmt = format or detect_format(file.filename)
+    if fmt not in IMPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format, expected one of: {', '.join(IMPORT_FORMATS)}")
+    
+    # Validation and hashing run in a process pool; keep the event loop free meanwhile
+    stream = io.TextIOWrapper(file.file, encoding="utf-8", newline="")
+    summary = await run_in_threadpool(run_import, kind, stream, fmt, owner, skip_invalid, dry_run)
+    if summary["invalid"] and not skip_invalid and not dry_run:
+        raise HTTPException(status_code=400, detail=summary)
+    return summary
+
+@app.post("/datasets/import", response_model=ImportSummary)
+async def import_datasets_endpoint(
+    file: UploadFile = File(...),
+    format: Optional[str] = None,
+    skip_invalid: bool = False,
+    dry_run: bool = False,
+    current_user: User = Depends(get_current_admin_user)
+):
+    return await import_upload("datasets", file, format, skip_invalid, dry_run, current_user)
+
+@app.post("/users/import", response_model=ImportSummary)
+async def import_users_endpoint(
+    file: UploadFile = File(...),
+    format: Optional[str] = None,
+    skip_invalid: bool = False,
+    dry_run: bool = False,
+    current_user: User = Depends(get_current_admin_user)
+):
+    return await import_upload("users", file, format, skip_invalid, dry_run, current_user)
+
 # Access request routes
 @app.post("/access-requests/", response_model=AccessRequest)
 async def create_new_access_request(request: AccessRequestCreate, current_user: User = Depends(get_current_active_user)):
@@ -288,9 +618,7 @@ async def create_new_access_request(request: AccessRequestCreate, current_user:
         expiry_date=None
     )
     
-    created_request = create_access_request(request_in_db)
-    
-    # Log activity
+    # Commit the record and its activity together
     activity = ActivityCreate(
         type="access_requested",
         user_id=current_user.id,
@@ -298,26 +626,42 @@ async def create_new_access_request(request: AccessRequestCreate, current_user:
         dataset_id=request.dataset_id,
         description=f"User {current_user.username} requested access to dataset {dataset.name}"
     )
-    create_activity(activity)
-    
-    return created_request
+    def request_access(tx):
+        # Checked again under the transaction, against concurrent requests
+        if has_pending_access_request(current_user.id, request.dataset_id, tx):
+            raise HTTPException(status_code=400, detail="You already have a pending request for this dataset")
+        return create_access_request(request_in_db, tx=tx)
+    return await activity_writer.log(activity, request_access)
 
 @app.get("/access-requests/", response_model=List[AccessRequest])
 async def read_access_requests(
     skip: int = 0, 
     limit: int = 100, 
     status: Optional[str] = None,
+    sort: Optional[str] = None,
     current_user: User = Depends(get_current_active_user)
 ):
+    sort = check_sort(sort, ACCESS_REQUEST_SORTS)
     # Regular users can only see their own requests
     if not current_user.is_admin:
-        requests = get_access_requests(user_id=current_user.id, status=status, skip=skip, limit=limit)
+        requests = get_access_requests(user_id=current_user.id, status=status, skip=skip, limit=limit, sort=sort)
     else:
         # Admins can see all requests
-        requests = get_access_requests(status=status, skip=skip, limit=limit)
+        requests = get_access_requests(status=status, skip=skip, limit=limit, sort=sort)
     
     return requests
 
+@app.get("/access-requests/export")
+async def export_access_requests(
+    format: str = "ndjson",
+    status: Optional[str] = None,
+    user_id: Optional[str] = None,
+    dataset_id: Optional[str] = None,
+    current_user: User = Depends(get_current_admin_user)
+):
+    rows = iter_access_requests(user_id=user_id, dataset_id=dataset_id, status=status)
+    return export_response(rows, list(AccessRequest.__fields__), format, "access_requests")
+
 @app.get("/access-requests/{request_id}", response_model=AccessRequest)
 async def read_access_request(request_id: str, current_user: User = Depends(get_current_active_user)):
     request = get_access_request(request_id)
@@ -330,6 +674,13 @@ async def read_access_request(request_id: str, current_user: User = Depends(get_
     
     return request
 
+def decide_pending_request(request_id: str, update_data: AccessRequestUpdate, tx) -> AccessRequest:
+    # Checked again under the transaction, so of an approve and a deny racing
+    # for the same request only the first is applied
+    if access_request_status(request_id, tx) != "pending":
+        raise HTTPException(status_code=400, detail="Request is not in pending status")
+    return update_access_request(request_id, update_data, tx=tx)
+
 @app.put("/access-requests/{request_id}/approve", response_model=AccessRequest)
 async def approve_access_request(request_id: str, current_user: User = Depends(get_current_admin_user)):
     request = get_access_request(request_id)
@@ -340,7 +691,7 @@ async def approve_access_request(request_id: str, current_user: User = Depends(g
         raise HTTPException(status_code=400, detail="Request is not in pending status")
     
     # Set expiry date to 1 year from now
-    expiry_date = datetime.utcnow() + timedelta(days=365)
+    expiry_date = datetime.utcnow() + ACCESS_GRANT_DURATION
     
     update_data = AccessRequestUpdate(
         status="approved",
@@ -348,13 +699,11 @@ async def approve_access_request(request_id: str, current_user: User = Depends(g
         expiry_date=expiry_date
     )
     
-    updated_request = update_access_request(request_id, update_data)
-    
     # Get user and dataset info for activity log
     user = get_user(id=request.user_id)
     dataset = get_dataset(request.dataset_id)
     
-    # Log activity
+    # Commit the decision and its activity together
     activity = ActivityCreate(
         type="access_granted",
         user_id=current_user.id,
@@ -362,7 +711,8 @@ async def approve_access_request(request_id: str, current_user: User = Depends(g
         dataset_id=dataset.id,
         description=f"Admin {current_user.username} granted access to dataset {dataset.name} for user {user.username}"
     )
-    create_activity(activity)
+    updated_request = await activity_writer.log(activity, lambda tx: decide_pending_request(request_id, update_data, tx))
+    record_dataset_grant(request.dataset_id)
     
     return updated_request
 
@@ -380,13 +730,11 @@ async def deny_access_request(request_id: str, current_user: User = Depends(get_
         denied_at=datetime.utcnow()
     )
     
-    updated_request = update_access_request(request_id, update_data)
-    
     # Get user and dataset info for activity log
     user = get_user(id=request.user_id)
     dataset = get_dataset(request.dataset_id)
     
-    # Log activity
+    # Commit the decision and its activity together
     activity = ActivityCreate(
         type="access_denied",
         user_id=current_user.id,
@@ -394,9 +742,17 @@ async def deny_access_request(request_id: str, current_user: User = Depends(get_
         dataset_id=dataset.id,
         description=f"Admin {current_user.username} denied access to dataset {dataset.name} for user {user.username}"
     )
-    create_activity(activity)
-    
-    return updated_request
+    return await activity_writer.log(activity, lambda tx: decide_pending_request(request_id, update_data, tx))
+
+@app.post("/access-requests/batch", response_model=List[AccessRequestDecisionOutcome])
+async def decide_access_requests_batch(batch: AccessRequestBatchDecision, current_user: User = Depends(get_current_admin_user)):
+    if batch.decision not in ("approve", "deny"):
+        raise HTTPException(status_code=400, detail="Decision must be 'approve' or 'deny'")
+    if not batch.request_ids:
+        raise HTTPException(status_code=400, detail="No request ids given")
+    check_batch_size(batch.request_ids)
+    
+    return decide_access_requests(batch.request_ids, batch.decision, current_user, all_or_nothing=batch.all_or_nothing)
 
 # Activity routes
 @app.get("/activities/", response_model=List[Activity])
@@ -404,11 +760,79 @@ async def read_activities(skip: int = 0, limit: int = 100, current_user: User =
     activities = get_activities(skip=skip, limit=limit)
     return activities
 
+@app.get("/activities/aggregate", response_model=ActivityAggregate)
+async def aggregate_activity_log(
+    group_by: str = "type",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    type: Optional[List[str]] = Query(None),
+    dataset_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+    limit: int = 100,
+    current_user: User = Depends(get_current_admin_user)
+):
+    if group_by not in ACTIVITY_GROUPINGS:
+        raise HTTPException(status_code=400, detail=f"Unknown group_by, expected one of: {', '.join(ACTIVITY_GROUPINGS)}")
+    if limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be at least 1")
+    return aggregate_activities(
+        group_by,
+        start=start,
+        end=end,
+        types=type,
+        dataset_id=dataset_id,
+        user_id=user_id,
+        limit=min(limit, MAX_ACTIVITY_GROUPS)
+    )
+
+@app.get("/activities/export")
+async def export_activities(format: str = "ndjson", current_user: User = Depends(get_current_admin_user)):
+    return export_response(iter_activities(), list(Activity.__fields__), format, "activities")
+
+# Change feed: non-admins may follow the catalog only
+@app.get("/changes", response_model=ChangeFeed)
+async def read_changes(
+    since: Optional[int] = None,
+    collections: Optional[str] = None,
+    wait: float = 0,
+    limit: int = 1000,
+    current_user: User = Depends(get_current_active_user)
+):
+    names = collections.split(",") if collections else (list(CHANGE_MODELS) if current_user.is_admin else ["datasets"])
+    unknown = [name for name in names if name not in CHANGE_MODELS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown collections: {', '.join(unknown)}; expected some of: {', '.join(CHANGE_MODELS)}")
+    if not current_user.is_admin and names != ["datasets"]:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    
+    # Without since, only report the current position to start following from
+    if since is None:
+        return ChangeFeed(changes=[], last_seq=change_log.last_seq)
+    
+    # Long poll: wait up to `wait` seconds for a change in the requested collections
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + max(0, min(wait, MAX_CHANGES_WAIT))
+    while True:
+        try:
+            feed = get_changes(since, names, max(1, min(limit, MAX_CHANGES)))
+        except ChangesExpired as e:
+            raise HTTPException(status_code=410, detail=f"{e}; reload the collections and follow from the current position")
+        remaining = deadline - loop.time()
+        if feed.changes or remaining <= 0:
+            return feed
+        since = feed.last_seq
+        await wait_for_changes(since, remaining)
+
 # Health check endpoint
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "timestamp": datetime.utcnow()}
 
+# Metrics endpoint (Prometheus text format)
+@app.get("/metrics", response_class=PlainTextResponse)
+async def read_metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 # Root endpoint
 @app.get("/")
 async def root():
@@ -37,6 +37,9 @@ class User(UserBase):
     class Config:
         orm_mode = True
 
+class BatchGet(BaseModel):
+    ids: List[str]
+
 # Token models
 class Token(BaseModel):
     access_token: str
@@ -86,6 +89,7 @@ class DatasetInDB(DatasetBase):
     image_url: str
     is_available: bool = True
     access_count: int = 0
+    view_count: int = 0
 
 class Dataset(DatasetBase):
     id: str
@@ -95,10 +99,28 @@ class Dataset(DatasetBase):
     image_url: str
     is_available: bool
     access_count: int
+    view_count: int = 0
+    # Parsed from sample_size / year_collected; None when not parseable
+    sample_size_value: Optional[int] = None
+    year_collected_start: Optional[int] = None
+    year_collected_end: Optional[int] = None
 
     class Config:
         orm_mode = True
 
+class TrendingDataset(BaseModel):
+    dataset: Dataset
+    score: float
+
+class SimilarDataset(BaseModel):
+    dataset: Dataset
+    score: float
+
+class DatasetSuggestion(BaseModel):
+    text: str
+    field: str  # name, keyword, institution
+    dataset_count: int
+
 # Access Request models
 class AccessRequestBase(BaseModel):
     dataset_id: str
@@ -111,7 +133,7 @@ class AccessRequestCreate(AccessRequestBase):
     pass
 
 class AccessRequestUpdate(BaseModel):
-    status: Optional[str] = None  # pending, approved, denied
+    status: Optional[str] = None  # pending, approved, denied, expired
     approved_at: Optional[datetime] = None
     denied_at: Optional[datetime] = None
     expiry_date: Optional[datetime] = None
@@ -119,7 +141,7 @@ class AccessRequestUpdate(BaseModel):
 class AccessRequestInDB(AccessRequestBase):
     id: str
     user_id: str
-    status: str  # pending, approved, denied
+    status: str  # pending, approved, denied, expired
     created_at: datetime
     updated_at: datetime
     approved_at: Optional[datetime] = None
@@ -139,9 +161,34 @@ class AccessRequest(AccessRequestBase):
     class Config:
         orm_mode = True
 
+class Entitlement(BaseModel):
+    # An approved, unexpired access request
+    user_id: str
+    dataset_id: str
+    request_id: str
+    approved_at: Optional[datetime] = None
+    expiry_date: Optional[datetime] = None
+
+class EntitlementCheck(BaseModel):
+    user_id: str
+    dataset_id: str
+    has_access: bool
+    entitlement: Optional[Entitlement] = None
+
+class AccessRequestBatchDecision(BaseModel):
+    request_ids: List[str]
+    decision: str  # approve, deny
+    all_or_nothing: bool = False  # apply nothing if any request in the batch is invalid
+
+class AccessRequestDecisionOutcome(BaseModel):
+    request_id: str
+    success: bool
+    detail: Optional[str] = None
+    request: Optional[AccessRequest] = None
+
 # Activity models
 class ActivityBase(BaseModel):
-    type: str  # user_registered, dataset_uploaded, dataset_updated, access_requested, access_granted, access_denied
+    type: str  # user_registered, dataset_uploaded, dataset_updated, access_requested, access_granted, access_denied, access_expired
     description: str
 
 class ActivityCreate(ActivityBase):
@@ -166,6 +213,40 @@ class Activity(ActivityBase):
     class Config:
         orm_mode = True
 
+class ActivityGroup(BaseModel):
+    key: Optional[str] = None  # type, dataset/user id, or ISO start of a time bucket
+    count: int
+
+class ActivityAggregate(BaseModel):
+    group_by: str
+    total: int  # matching activities, including groups beyond limit
+    groups: List[ActivityGroup]
+
+# Change feed models
+class Change(BaseModel):
+    seq: int
+    collection: str  # users, datasets, access_requests, activities
+    id: str
+    record: Dict[str, Any]  # the record as written, in its API form
+
+class ChangeFeed(BaseModel):
+    changes: List[Change]
+    last_seq: int  # pass as since to continue after these changes
+
+# Bulk import models
+
+class ImportRowError(BaseModel):
+    line: int
+    error: str
+
+class ImportSummary(BaseModel):
+    kind: str  # datasets, users
+    rows: int
+    valid: int
+    invalid: int
+    imported: int
+    errors: List[ImportRowError]
+
 # Dataset Statistics and Metadata models
 class DatasetStats(BaseModel):
     total_participants: int
@@ -189,3 +270,12 @@ class DatasetMetadata(BaseModel):
     publications: Optional[List[Dict[str, Any]]] = None
     citation_text: Optional[str] = None
     citation_count: Optional[int] = None
+
+class DatasetDetail(BaseModel):
+    dataset: Dataset
+    stats: DatasetStats
+    metadata: DatasetMetadata
+    # The caller's most recent access request for the dataset, and whether
+    # they currently hold a grant; both None for anonymous callers
+    access_request: Optional[AccessRequest] = None
+    has_access: Optional[bool] = None
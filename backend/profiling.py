@@ -0,0 +1,178 @@
+from typing import Callable, Dict, Optional, Tuple
+from datetime import datetime
+import cProfile
+import io
+import os
+import pstats
+import time
+
+# On-demand profiling of single requests.
+# With profiling enabled, an admin can send "X-Profile: save" to have the
+# request run under cProfile and the result written to PROFILE_DIR, or
+# "X-Profile: attach" to get the report back instead of the response body.
+# The middleware is only installed when profiling is enabled, so ordinary
+# deployments pay nothing for it.
+#
+# cProfile instruments the event loop thread, so anything else that runs on
+# the loop while the profiled request is awaiting shows up in its profile.
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_MODES = ("save", "attach")
+
+# Report sections: label -> predicate on a pstats function key
+# (filename, line number, function name)
+HOTSPOTS: Dict[str, Callable[[Tuple[str, int, str]], bool]] = {
+    "read_json_file": lambda func: func[2] == "read_json_file",
+    "write_json_file": lambda func: func[2] == "write_json_file",
+    "pydantic model construction": lambda func: func[2] == "pydantic_model_init",
+    "bcrypt (passlib hash/verify)": lambda func: func[0].endswith(os.path.join("passlib", "context.py")) and func[2] in ("hash", "verify"),
+}
+
+# pydantic is usually installed as a compiled extension, which cProfile can't
+# see into; while a profiled request runs, model construction goes through a
+# named Python shim so it shows up in the stats
+_pydantic_patches = 0
+_pydantic_init = None
+
+def _patch_pydantic():
+    global _pydantic_patches, _pydantic_init
+    from pydantic import BaseModel
+
+    _pydantic_patches += 1
+    if _pydantic_patches > 1:
+        return
+
+    original = _pydantic_init = BaseModel.__init__
+
+    def pydantic_model_init(__pydantic_self__, **data):
+        original(__pydantic_self__, **data)
+
+    BaseModel.__init__ = pydantic_model_init
+
+def _unpatch_pydantic():
+    global _pydantic_patches
+    from pydantic import BaseModel
+
+    _pydantic_patches -= 1
+    if _pydantic_patches == 0:
+        BaseModel.__init__ = _pydantic_init
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+def _bearer_token(scope) -> Optional[str]:
+    authorization = _header(scope, b"authorization")
+    if authorization and authorization.lower().startswith("bearer "):
+        return authorization[7:]
+    return None
+
+def build_report(profile: cProfile.Profile, title: str, elapsed: float) -> str:
+    stream = io.StringIO()
+    stats = pstats.Stats(profile, stream=stream)
+
+    stream.write(f"{title}\n")
+    stream.write(f"wall time: {elapsed * 1000:.2f} ms\n\n")
+    stream.write("Hotspots (cumulative seconds, calls):\n")
+    for label, matches in HOTSPOTS.items():
+        cumulative = 0.0
+        calls = 0
+        for func, (_, primitive_calls, _, func_cumulative, _) in stats.stats.items():
+            if matches(func):
+                cumulative += func_cumulative
+                calls += primitive_calls
+        stream.write(f"  {label:<32} {cumulative:10.6f}s {calls:8d}\n")
+    stream.write("\n")
+
+    stats.sort_stats("cumulative")
+    stats.print_stats(40)
+    stats.print_callees(15)
+    return stream.getvalue()
+
+class ProfilingMiddleware:
+    def __init__(self, app, directory: str, is_admin: Callable[[str], bool]):
+        self.app = app
+        self.directory = directory
+        self.is_admin = is_admin
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        mode = _header(scope, PROFILE_HEADER)
+        if mode is None:
+            await self.app(scope, receive, send)
+            return
+
+        mode = mode.strip().lower() or "save"
+        token = _bearer_token(scope)
+        if mode not in PROFILE_MODES or token is None or not self.is_admin(token):
+            # Profiling is an admin diagnostic; anyone else just gets the response
+            await self.app(scope, receive, send)
+            return
+
+        title = f"{scope['method']} {scope['path']}"
+        if scope.get("query_string"):
+            title += "?" + scope["query_string"].decode("latin-1")
+
+        if mode == "attach":
+            await self._profile_attach(scope, receive, send, title)
+        else:
+            await self._profile_save(scope, receive, send, title)
+
+    async def _run_profiled(self, scope, receive, send) -> Tuple[cProfile.Profile, float]:
+        profile = cProfile.Profile()
+        _patch_pydantic()
+        start = time.perf_counter()
+        profile.enable()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profile.disable()
+            _unpatch_pydantic()
+        return profile, time.perf_counter() - start
+
+    async def _profile_save(self, scope, receive, send, title):
+        name = f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')}-{scope['method'].lower()}"
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                # Headers go out before the profile is written, so announce the file name now
+                headers = list(message.get("headers", []))
+                headers.append((b"x-profile-id", name.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        profile, elapsed = await self._run_profiled(scope, receive, send_wrapper)
+        report = build_report(profile, title, elapsed)
+
+        os.makedirs(self.directory, exist_ok=True)
+        profile.dump_stats(os.path.join(self.directory, name + ".prof"))
+        with open(os.path.join(self.directory, name + ".txt"), "w") as f:
+            f.write(report)
+
+    async def _profile_attach(self, scope, receive, send, title):
+        status_code = 500
+
+        async def discard(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+
+        profile, elapsed = await self._run_profiled(scope, receive, discard)
+        report = build_report(profile, f"{title} -> {status_code}", elapsed).encode("utf-8")
+
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/plain; charset=utf-8"),
+                (b"content-disposition", b'attachment; filename="profile.txt"'),
+                (b"content-length", str(len(report)).encode("latin-1")),
+                (b"x-profiled-status", str(status_code).encode("latin-1")),
+            ],
+        })
+        await send({"type": "http.response.body", "body": report})
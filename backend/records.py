@@ -0,0 +1,101 @@
+from typing import Any, Dict, Iterable, Iterator, Mapping, Type
+from datetime import datetime
+import sys
+
+from models import AccessRequestInDB, ActivityInDB, Dataset, UserInDB
+
+# Compact in-memory records for the large collections.
+# A parsed JSON row is a dict of a dozen keys (~650 bytes before its values)
+# whose repeated strings (status, type, institution, ids) are separate
+# objects in every row. Records keep the fields in __slots__, intern the
+# categorical values so each distinct one is stored once, and hold
+# timestamps as datetimes rather than ISO strings.
+#
+# They stay read-only mappings: record["status"], record.get(...),
+# dict(record) and Model(**record) work as with the dict rows, so code that
+# reads index records does not change, and API models are only built at the
+# response boundary. Fields missing from the row stay unset, as a missing key.
+
+class Record:
+    __slots__ = ()
+    categorical: frozenset = frozenset()
+    datetimes: frozenset = frozenset()
+
+    def __init__(self, row: Mapping[str, Any]):
+        for field in self.__slots__:
+            if field not in row:
+                continue
+            value = row[field]
+            if value is not None:
+                if field in self.categorical and isinstance(value, str):
+                    value = sys.intern(value)
+                elif field in self.datetimes and isinstance(value, str):
+                    value = parse_datetime(value)
+            setattr(self, field, value)
+
+    def __getitem__(self, field: str) -> Any:
+        try:
+            return getattr(self, field)
+        except AttributeError:
+            raise KeyError(field) from None
+
+    def get(self, field: str, default: Any = None) -> Any:
+        return getattr(self, field, default)
+
+    def __contains__(self, field: str) -> bool:
+        return hasattr(self, field)
+
+    def keys(self) -> Iterator[str]:
+        return (field for field in self.__slots__ if hasattr(self, field))
+
+    def __iter__(self) -> Iterator[str]:
+        return self.keys()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {field: getattr(self, field) for field in self.keys()}
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+def parse_datetime(value: str) -> Any:
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return value
+
+def record_type(name: str, fields: Iterable[str], categorical: Iterable[str] = (), datetimes: Iterable[str] = ()) -> Type[Record]:
+    return type(name, (Record,), {
+        "__slots__": tuple(fields),
+        "categorical": frozenset(categorical),
+        "datetimes": frozenset(datetimes),
+    })
+
+# Fields follow the stored models; Dataset includes the parsed sample size
+# and collection years added by database.normalize_dataset
+DatasetRecord = record_type(
+    "DatasetRecord",
+    Dataset.__fields__,
+    categorical=("data_type", "access_type", "collaboration_type", "institution", "owner_id", "image_url"),
+    datetimes=("created_at", "updated_at")
+)
+
+AccessRequestRecord = record_type(
+    "AccessRequestRecord",
+    AccessRequestInDB.__fields__,
+    categorical=("status", "dataset_id", "user_id"),
+    datetimes=("created_at", "updated_at", "approved_at", "denied_at", "expiry_date")
+)
+
+UserRecord = record_type(
+    "UserRecord",
+    UserInDB.__fields__,
+    categorical=("institution",),
+    datetimes=("created_at",)
+)
+
+ActivityRecord = record_type(
+    "ActivityRecord",
+    ActivityInDB.__fields__,
+    categorical=("type", "user_id", "target_id", "dataset_id"),
+    datetimes=("timestamp",)
+)
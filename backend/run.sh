@@ -3,5 +3,9 @@
 # Create database directory if it doesn't exist
 mkdir -p db
 
-# Run the FastAPI server
+# Run the FastAPI server: one auto-reloading process by default, or
+# pre-forked workers sharing the loaded data when WORKERS is above 1
+if [ "${WORKERS:-1}" -gt 1 ]; then
+    exec python serve.py --workers "$WORKERS" --host 0.0.0.0 --port 8000
+fi
 uvicorn main:app --reload --host 0.0.0.0 --port 8000
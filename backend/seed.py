@@ -2,13 +2,10 @@ import json
 import os
 import uuid
 from datetime import datetime, timedelta
-from passlib.context import CryptContext
-
-# Initialize password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from bulk_import import hash_passwords
 
 # Ensure database directory exists
-DB_DIR = "db"
+DB_DIR = os.getenv("DB_DIR", "db")
 os.makedirs(DB_DIR, exist_ok=True)
 
 # Define database file paths
@@ -25,7 +22,7 @@ users = [
         "email": "admin@example.com",
         "full_name": "Admin User",
         "institution": "Clinical Dataset Hub",
-        "hashed_password": pwd_context.hash("password123"),
+        "hashed_password": None,
         "is_admin": True,
         "is_active": True,
         "created_at": datetime.utcnow().isoformat(),
@@ -37,7 +34,7 @@ users = [
         "email": "researcher@example.com",
         "full_name": "Dr. John Smith",
         "institution": "University Medical Center",
-        "hashed_password": pwd_context.hash("password123"),
+        "hashed_password": None,
         "is_admin": False,
         "is_active": True,
         "created_at": datetime.utcnow().isoformat(),
@@ -49,7 +46,7 @@ users = [
         "email": "sarah.johnson@stanford.edu",
         "full_name": "Sarah Johnson",
         "institution": "Stanford University",
-        "hashed_password": pwd_context.hash("password123"),
+        "hashed_password": None,
         "is_admin": False,
         "is_active": True,
         "created_at": datetime.utcnow().isoformat(),
@@ -61,7 +58,7 @@ users = [
         "email": "m.chen@jhu.edu",
         "full_name": "Michael Chen",
         "institution": "Johns Hopkins University",
-        "hashed_password": pwd_context.hash("password123"),
+        "hashed_password": None,
         "is_admin": False,
         "is_active": True,
         "created_at": datetime.utcnow().isoformat(),
@@ -73,7 +70,7 @@ users = [
         "email": "e.rodriguez@ucla.edu",
         "full_name": "Emily Rodriguez",
         "institution": "UCLA Medical Center",
-        "hashed_password": pwd_context.hash("password123"),
+        "hashed_password": None,
         "is_admin": False,
         "is_active": True,
         "created_at": datetime.utcnow().isoformat(),
@@ -389,11 +386,18 @@ def write_json_file(file_path, data):
     with open(file_path, "w") as f:
         json.dump(data, f, default=str, indent=2)
 
-write_json_file(USERS_FILE, users)
-write_json_file(DATASETS_FILE, datasets)
-write_json_file(ACCESS_REQUESTS_FILE, access_requests)
-write_json_file(ACTIVITIES_FILE, activities)
+# Hashing runs in worker processes, which re-import this module, so the
+# side effects only happen when it is run as a script
+if __name__ == "__main__":
+    # Hash passwords in parallel across cores
+    for user, hashed_password in zip(users, hash_passwords(["password123"] * len(users))):
+        user["hashed_password"] = hashed_password
+
+    write_json_file(USERS_FILE, users)
+    write_json_file(DATASETS_FILE, datasets)
+    write_json_file(ACCESS_REQUESTS_FILE, access_requests)
+    write_json_file(ACTIVITIES_FILE, activities)
 
-print("Database seeded successfully!")
-print(f"Admin user: {users[0]['username']} / password123")
-print(f"Regular user: {users[1]['username']} / password123")
+    print("Database seeded successfully!")
+    print(f"Admin user: {users[0]['username']} / password123")
+    print(f"Regular user: {users[1]['username']} / password123")
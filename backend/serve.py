@@ -0,0 +1,103 @@
+"""Run the API in several worker processes sharing one listening socket.
+
+    python serve.py --workers 4 --host 0.0.0.0 --port 8000
+
+Run from the backend directory (run.sh does this when WORKERS is above 1).
+The collections are loaded and indexed once here, then the workers are
+forked, so they start with the indexes already built and share those pages
+until they change. Writes from any worker are serialized by a file lock and
+announced to the others, which apply them to their own indexes (see
+workers.py and database.sync_remote_changes).
+"""
+import argparse
+import gc
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve the API from pre-forked worker processes")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--log-level", default="info")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    socket_dir = tempfile.mkdtemp(prefix="dataset-hub-workers-")
+    # Read by database when it is imported, so it has to be set first
+    os.environ["WORKER_SOCKET_DIR"] = socket_dir
+
+    import uvicorn
+    import database
+    from main import app
+
+    database.preload()
+    # Move everything loaded so far out of the collector's reach, so its
+    # passes in the workers don't write to (and copy) the shared pages
+    gc.collect()
+    gc.freeze()
+
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((args.host, args.port))
+    listener.listen(2048)
+    listener.set_inheritable(True)
+
+    workers = set()
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            # Own process group: a terminal's Ctrl+C reaches only this
+            # process, which stops the workers itself
+            os.setpgid(0, 0)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            server = uvicorn.Server(uvicorn.Config(app, log_level=args.log_level))
+            server.run(sockets=[listener])
+            os._exit(0)
+        workers.add(pid)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for _ in range(args.workers):
+        spawn()
+    print(f"Serving on http://{args.host}:{args.port} with {args.workers} workers", file=sys.stderr)
+
+    try:
+        while workers:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            workers.discard(pid)
+            # A worker that was killed leaves its socket behind
+            try:
+                os.unlink(os.path.join(socket_dir, f"worker-{pid}.sock"))
+            except FileNotFoundError:
+                pass
+            if not stopping:
+                print(f"Worker {pid} exited with status {status}; restarting", file=sys.stderr)
+                time.sleep(1)
+                spawn()
+    finally:
+        shutil.rmtree(socket_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
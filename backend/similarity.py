@@ -0,0 +1,192 @@
+from typing import Any, Callable, Dict, List, Set, Tuple
+import math
+import re
+import threading
+
+import numpy as np
+
+from indexes import SecondaryIndex
+
+# "Similar datasets" by TF-IDF cosine similarity.
+# Term counts are kept per record and updated on every write; the weighted,
+# normalised vectors live in a column-major sparse matrix (a snapshot) that
+# is rebuilt in one vectorised pass by refresh(). Records written since the
+# last snapshot are scored separately until the next refresh, so an edit
+# never rebuilds the matrix on the request path.
+
+TOKEN = re.compile(r"[a-z][a-z0-9]+")
+
+STOP_WORDS = frozenset("""
+    a an and are as at be by data dataset datasets for from in including into is it of on or
+    that the their this to was were with
+""".split())
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in TOKEN.findall(text.lower()) if token not in STOP_WORDS]
+
+def idf(document_frequency: int, documents: int) -> float:
+    return math.log((1 + documents) / (1 + document_frequency)) + 1
+
+class Snapshot:
+    """TF-IDF matrix for a fixed set of records, stored by column (term)."""
+
+    def __init__(self, docs: Dict[str, Dict[str, int]]):
+        self.docs = dict(docs)
+        self.ids = list(docs)
+        self.row = {record_id: i for i, record_id in enumerate(self.ids)}
+        self.valid = np.ones(len(self.ids), dtype=bool)
+
+        vocabulary: Dict[str, int] = {}
+        rows, columns, counts = [], [], []
+        for i, terms in enumerate(docs.values()):
+            for term, count in terms.items():
+                rows.append(i)
+                columns.append(vocabulary.setdefault(term, len(vocabulary)))
+                counts.append(count)
+        self.vocabulary = vocabulary
+        rows = np.array(rows, dtype=np.int32)
+        columns = np.array(columns, dtype=np.int32)
+
+        document_frequency = np.bincount(columns, minlength=len(vocabulary))
+        self.idf = np.log((1 + len(self.ids)) / (1 + document_frequency)) + 1
+        weights = (1 + np.log(np.array(counts, dtype=np.float64))) * self.idf[columns]
+        norms = np.sqrt(np.bincount(rows, weights ** 2, minlength=len(self.ids)))
+        weights /= norms[rows]
+
+        order = np.argsort(columns, kind="stable")
+        self.rows = rows[order]
+        self.weights = weights[order].astype(np.float32)
+        self.column_start = np.concatenate(([0], np.cumsum(document_frequency)))
+
+    def scores(self, vector: Dict[str, float]) -> np.ndarray:
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for term, weight in vector.items():
+            column = self.vocabulary.get(term)
+            if column is None:
+                continue
+            start, end = self.column_start[column], self.column_start[column + 1]
+            # Rows are distinct within a column, so fancy-index += is safe
+            scores[self.rows[start:end]] += weight * self.weights[start:end]
+        scores[~self.valid] = 0
+        return scores
+
+class SimilarityIndex(SecondaryIndex):
+    def __init__(self, text: Callable[[Dict[str, Any]], str]):
+        self.text = text
+        self._docs: Dict[str, Dict[str, int]] = {}
+        self._document_frequency: Dict[str, int] = {}
+        # Records added or changed since the snapshot was built
+        self._pending: Set[str] = set()
+        self._snapshot = Snapshot({})
+        # add/remove run on the request path, refresh() may run in a thread
+        self._lock = threading.Lock()
+
+    def _terms(self, record) -> Dict[str, int]:
+        terms: Dict[str, int] = {}
+        for token in tokenize(self.text(record)):
+            terms[token] = terms.get(token, 0) + 1
+        return terms
+
+    @property
+    def stale(self) -> bool:
+        return bool(self._pending) or not self._snapshot.valid.all()
+
+    def clear(self):
+        with self._lock:
+            self._docs = {}
+            self._document_frequency = {}
+            self._pending = set()
+            self._snapshot = Snapshot({})
+
+    def add(self, record_id, record):
+        terms = self._terms(record)
+        with self._lock:
+            snapshot = self._snapshot
+            row = snapshot.row.get(record_id)
+            if row is not None and snapshot.docs[record_id] == terms:
+                # Text unchanged (e.g. only counters changed): keep the snapshot row
+                terms = snapshot.docs[record_id]
+                snapshot.valid[row] = True
+            else:
+                self._pending.add(record_id)
+            self._docs[record_id] = terms
+            for term in terms:
+                self._document_frequency[term] = self._document_frequency.get(term, 0) + 1
+
+    def remove(self, record_id, record):
+        with self._lock:
+            terms = self._docs.pop(record_id, None)
+            if terms is None:
+                return
+            for term in terms:
+                self._document_frequency[term] -= 1
+                if not self._document_frequency[term]:
+                    del self._document_frequency[term]
+            self._pending.discard(record_id)
+            row = self._snapshot.row.get(record_id)
+            if row is not None:
+                self._snapshot.valid[row] = False
+
+    def rebuild(self, records):
+        self.clear()
+        docs = {record_id: self._terms(record) for record_id, record in records.items()}
+        document_frequency: Dict[str, int] = {}
+        for terms in docs.values():
+            for term in terms:
+                document_frequency[term] = document_frequency.get(term, 0) + 1
+        snapshot = Snapshot(docs)
+        with self._lock:
+            self._docs = docs
+            self._document_frequency = document_frequency
+            self._snapshot = snapshot
+
+    def refresh(self):
+        """Rebuild the snapshot from the current term counts (safe to run in a thread)."""
+        with self._lock:
+            docs = dict(self._docs)
+        snapshot = Snapshot(docs)
+        with self._lock:
+            # Apply whatever was written while the snapshot was being built
+            for record_id, row in snapshot.row.items():
+                if self._docs.get(record_id) is not docs[record_id]:
+                    snapshot.valid[row] = False
+            self._pending = {
+                record_id for record_id in self._pending
+                if self._docs.get(record_id) is not docs.get(record_id)
+            }
+            self._snapshot = snapshot
+
+    def _vector(self, terms: Dict[str, int]) -> Dict[str, float]:
+        documents = len(self._docs)
+        vector = {
+            term: (1 + math.log(count)) * idf(self._document_frequency.get(term, 0), documents)
+            for term, count in terms.items()
+        }
+        norm = math.sqrt(sum(weight * weight for weight in vector.values())) or 1.0
+        return {term: weight / norm for term, weight in vector.items()}
+
+    def similar(self, record_id: str, limit: int = 10) -> List[Tuple[str, float]]:
+        """Up to limit (id, cosine similarity) pairs, most similar first."""
+        with self._lock:
+            terms = self._docs.get(record_id)
+            if not terms or limit <= 0:
+                return []
+            vector = self._vector(terms)
+            snapshot = self._snapshot
+            pending = [(other, self._vector(self._docs[other])) for other in self._pending if other != record_id]
+
+        scores = snapshot.scores(vector)
+        own_row = snapshot.row.get(record_id)
+        if own_row is not None:
+            scores[own_row] = 0
+        count = min(limit, len(scores))
+        best = np.argpartition(-scores, count - 1)[:count] if count else []
+        candidates = [(snapshot.ids[row], float(scores[row])) for row in best if scores[row] > 0]
+
+        for other, other_vector in pending:
+            score = sum(weight * other_vector.get(term, 0.0) for term, weight in vector.items())
+            if score > 0:
+                candidates.append((other, score))
+
+        candidates.sort(key=lambda item: item[1], reverse=True)
+        return candidates[:limit]
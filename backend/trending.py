@@ -0,0 +1,146 @@
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime, timezone
+import heapq
+import threading
+import time
+
+# Trending datasets from sliding-window event counts.
+# Every window is a ring of fixed-width time buckets; per-dataset totals are
+# kept up to date as events arrive and buckets expire, and a bounded min-heap
+# tracks the current leaders so reads never rescan the activity history.
+
+# Event weights: a granted request says more about interest than a page view
+EVENT_WEIGHTS = {
+    "dataset_viewed": 1,
+    "access_requested": 5,
+    "access_granted": 10,
+}
+
+# window name -> (bucket width in seconds, number of buckets)
+TRENDING_WINDOWS = {
+    "hour": (60, 60),
+    "day": (900, 96),
+    "week": (3600, 168),
+}
+
+# How many leaders each window keeps; requests are capped to this
+TOP_CAPACITY = 50
+
+def to_epoch(value) -> float:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+class WindowCounter:
+    def __init__(self, bucket_seconds: int, num_buckets: int, capacity: int = TOP_CAPACITY):
+        self.bucket_seconds = bucket_seconds
+        self.num_buckets = num_buckets
+        self.capacity = capacity
+        self._buckets: List[Dict[str, float]] = [{} for _ in range(num_buckets)]
+        self._head = None  # absolute index of the newest bucket
+        self._totals: Dict[str, float] = {}
+        # Leaders: current scores plus a min-heap with lazily deleted entries
+        self._top: Dict[str, float] = {}
+        self._heap: List[Tuple[float, str]] = []
+
+    def _advance(self, bucket: int):
+        if self._head is None:
+            self._head = bucket
+            return
+        if bucket <= self._head:
+            return
+
+        expired = False
+        if bucket - self._head >= self.num_buckets:
+            # The whole ring is older than the window
+            expired = bool(self._totals)
+            for slot in self._buckets:
+                slot.clear()
+            self._totals.clear()
+        else:
+            # Each slot being reused still holds the bucket one ring-length older
+            for absolute in range(self._head + 1, bucket + 1):
+                slot = self._buckets[absolute % self.num_buckets]
+                if not slot:
+                    continue
+                for key, weight in slot.items():
+                    total = self._totals[key] - weight
+                    if total <= 0:
+                        del self._totals[key]
+                    else:
+                        self._totals[key] = total
+                slot.clear()
+                expired = True
+        self._head = bucket
+
+        if expired:
+            self._rebuild_top()
+
+    def _rebuild_top(self):
+        leaders = heapq.nlargest(self.capacity, self._totals.items(), key=lambda item: item[1])
+        self._top = dict(leaders)
+        self._heap = [(score, key) for key, score in leaders]
+        heapq.heapify(self._heap)
+
+    def _floor(self) -> Tuple[float, str]:
+        # Drop heap entries whose score no longer matches the leader table
+        while self._heap and self._top.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0]
+
+    def _update_top(self, key: str, total: float):
+        if key not in self._top and len(self._top) >= self.capacity:
+            floor_score, floor_key = self._floor()
+            # Totals only grow between expiries, so a key outside the table
+            # can only enter by overtaking the current floor
+            if total <= floor_score:
+                return
+            heapq.heappop(self._heap)
+            del self._top[floor_key]
+        self._top[key] = total
+        heapq.heappush(self._heap, (total, key))
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(score, k) for k, score in self._top.items()]
+            heapq.heapify(self._heap)
+
+    def add(self, key: str, timestamp: float, weight: float = 1):
+        bucket = int(timestamp // self.bucket_seconds)
+        self._advance(bucket)
+        if bucket <= self._head - self.num_buckets:
+            return  # older than the window
+
+        slot = self._buckets[bucket % self.num_buckets]
+        slot[key] = slot.get(key, 0) + weight
+        total = self._totals.get(key, 0) + weight
+        self._totals[key] = total
+        self._update_top(key, total)
+
+    def top(self, k: int, now: float) -> List[Tuple[str, float]]:
+        self._advance(int(now // self.bucket_seconds))
+        return sorted(self._top.items(), key=lambda item: (-item[1], item[0]))[:k]
+
+class TrendingTracker:
+    def __init__(self, windows: Dict[str, Tuple[int, int]] = TRENDING_WINDOWS):
+        self._lock = threading.Lock()
+        self.windows = {
+            name: WindowCounter(bucket_seconds, num_buckets)
+            for name, (bucket_seconds, num_buckets) in windows.items()
+        }
+
+    def record(self, dataset_id: Optional[str], event_type: str, timestamp=None, count: int = 1):
+        # count: how many such events happened at timestamp
+        weight = EVENT_WEIGHTS.get(event_type)
+        if not dataset_id or not weight:
+            return
+
+        when = time.time() if timestamp is None else to_epoch(timestamp)
+        with self._lock:
+            for window in self.windows.values():
+                window.add(dataset_id, when, weight * count)
+
+    def top(self, window: str, k: int = 10) -> List[Tuple[str, float]]:
+        with self._lock:
+            # Clamped at 0: [:k] with a negative k would return most leaders
+            return self.windows[window].top(max(0, min(k, TOP_CAPACITY)), time.time())
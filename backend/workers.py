@@ -0,0 +1,117 @@
+from typing import Callable, Optional
+import asyncio
+import os
+import socket
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single process, so the storage lock is enough
+    fcntl = None
+
+# Coordination between the worker processes of one server (see serve.py).
+# Workers share the files in DB_DIR but each keeps its own in-memory
+# indexes. Writes are serialized across processes by an flock on a lock
+# file, and after each commit the writer pokes every other worker through a
+# Unix datagram socket so they pick up the commit from the change log (see
+# database.sync_remote_changes) instead of waiting for a request to notice
+# the changed file.
+
+class WriteLock:
+    """Exclusive flock on a file, held by at most one process at a time.
+
+    Not reentrant across threads; callers hold the storage lock first.
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self._fd: Optional[int] = None
+        self._pid: Optional[int] = None
+
+    def __enter__(self) -> "WriteLock":
+        if fcntl is not None:
+            # flock belongs to the open file, which a forked worker would
+            # share with its parent, so each process opens its own
+            if self._pid != os.getpid():
+                self._fd = os.open(self.file_path, os.O_RDWR | os.O_CREAT, 0o644)
+                self._pid = os.getpid()
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+class WorkerChannel:
+    """One Unix datagram socket per worker in a shared directory.
+
+    Disabled (every call a no-op) when no directory is configured, i.e. when
+    the app runs as a single process.
+    """
+
+    def __init__(self, directory: Optional[str]):
+        self.directory = directory
+        self._socket: Optional[socket.socket] = None
+        self._sender: Optional[socket.socket] = None
+        self._sender_pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    def _path(self, pid: int) -> str:
+        return os.path.join(self.directory, f"worker-{pid}.sock")
+
+    def listen(self, callback: Callable[[], None]):
+        # Call callback on the running event loop whenever another worker
+        # commits; bursts of notifications are coalesced into one call
+        if not self.enabled:
+            return
+        path = self._path(os.getpid())
+        if os.path.exists(path):
+            os.unlink(path)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.bind(path)
+        self._socket.setblocking(False)
+        asyncio.get_running_loop().add_reader(self._socket.fileno(), self._receive, callback)
+
+    def _receive(self, callback: Callable[[], None]):
+        try:
+            while True:
+                self._socket.recv(64)
+        except BlockingIOError:
+            pass
+        callback()
+
+    def notify(self):
+        # Best effort: a worker whose queue is full or that has gone away is
+        # skipped; it still sees the commit on its next sync or file check
+        if not self.enabled:
+            return
+        own = os.path.basename(self._path(os.getpid()))
+        try:
+            names = [name for name in os.listdir(self.directory) if name.endswith(".sock") and name != own]
+        except FileNotFoundError:
+            return
+        with self._lock:
+            if self._sender_pid != os.getpid():
+                self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+                self._sender.setblocking(False)
+                self._sender_pid = os.getpid()
+            for name in names:
+                try:
+                    self._sender.sendto(b"1", os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def close(self):
+        if self._socket is None:
+            return
+        asyncio.get_running_loop().remove_reader(self._socket.fileno())
+        self._socket.close()
+        self._socket = None
+        try:
+            os.unlink(self._path(os.getpid()))
+        except FileNotFoundError:
+            pass
@@ -56,8 +56,33 @@ export const userAPI = {
     return response.data;
   },
 
-  getUsers: async (skip = 0, limit = 100) => {
-    const response = await api.get(`/users/?skip=${skip}&limit=${limit}`);
+  getUsers: async (skip = 0, limit = 100, params: any = {}) => {
+    const { search, institution, isAdmin, isActive, sort } = params;
+    let url = `/users/?skip=${skip}&limit=${limit}`;
+
+    if (search) url += `&search=${encodeURIComponent(search)}`;
+    if (institution) url += `&institution=${encodeURIComponent(institution)}`;
+    if (isAdmin != null) url += `&is_admin=${isAdmin}`;
+    if (isActive != null) url += `&is_active=${isActive}`;
+    if (sort) url += `&sort=${encodeURIComponent(sort)}`;
+
+    const response = await api.get(url);
+    return response.data;
+  },
+
+  // Resolves many users in one round trip; null for unknown ids
+  getUsersByIds: async (ids: string[]) => {
+    const response = await api.post("/users/batch", { ids });
+    return response.data;
+  },
+
+  getEntitlements: async (userId: string) => {
+    const response = await api.get(`/users/${userId}/entitlements`);
+    return response.data;
+  },
+
+  checkEntitlement: async (userId: string, datasetId: string) => {
+    const response = await api.get(`/users/${userId}/entitlements/${datasetId}`);
     return response.data;
   },
 };
@@ -65,21 +90,37 @@ export const userAPI = {
 // Dataset API
 export const datasetAPI = {
   getDatasets: async (params: any = {}) => {
-    const { skip = 0, limit = 100, search, dataType } = params;
+    const { skip = 0, limit = 100, search, dataType, minSampleSize, maxSampleSize, collectedFrom, collectedTo, sort } = params;
     let url = `/datasets/?skip=${skip}&limit=${limit}`;
 
     if (search) url += `&search=${encodeURIComponent(search)}`;
     if (dataType) url += `&data_type=${encodeURIComponent(dataType)}`;
+    if (minSampleSize != null) url += `&min_sample_size=${minSampleSize}`;
+    if (maxSampleSize != null) url += `&max_sample_size=${maxSampleSize}`;
+    if (collectedFrom != null) url += `&collected_from=${collectedFrom}`;
+    if (collectedTo != null) url += `&collected_to=${collectedTo}`;
+    if (sort) url += `&sort=${encodeURIComponent(sort)}`;
 
     const response = await api.get(url);
     return response.data;
   },
 
+  suggestDatasets: async (prefix: string, limit = 10) => {
+    const response = await api.get(`/datasets/suggest?prefix=${encodeURIComponent(prefix)}&limit=${limit}`);
+    return response.data;
+  },
+
   getDataset: async (id: string) => {
     const response = await api.get(`/datasets/${id}`);
     return response.data;
   },
 
+  // Resolves many datasets in one round trip; null for unknown ids
+  getDatasetsByIds: async (ids: string[]) => {
+    const response = await api.post("/datasets/batch", { ids });
+    return response.data;
+  },
+
   createDataset: async (datasetData: any) => {
     const response = await api.post("/datasets/", datasetData);
     return response.data;
@@ -90,6 +131,16 @@ export const datasetAPI = {
     return response.data;
   },
 
+  getDatasetFull: async (id: string) => {
+    const response = await api.get(`/datasets/${id}/full`);
+    return response.data;
+  },
+
+  getSimilarDatasets: async (id: string, limit = 10) => {
+    const response = await api.get(`/datasets/${id}/similar?limit=${limit}`);
+    return response.data;
+  },
+
   getDatasetStats: async (id: string) => {
     const response = await api.get(`/datasets/${id}/stats`);
     return response.data;
@@ -104,10 +155,11 @@ export const datasetAPI = {
 // Access Request API
 export const accessRequestAPI = {
   getAccessRequests: async (params: any = {}) => {
-    const { skip = 0, limit = 100, status } = params;
+    const { skip = 0, limit = 100, status, sort } = params;
     let url = `/access-requests/?skip=${skip}&limit=${limit}`;
 
     if (status) url += `&status=${encodeURIComponent(status)}`;
+    if (sort) url += `&sort=${encodeURIComponent(sort)}`;
 
     const response = await api.get(url);
     return response.data;
@@ -140,6 +192,41 @@ export const activityAPI = {
     const response = await api.get(`/activities/?skip=${skip}&limit=${limit}`);
     return response.data;
   },
+
+  // e.g. { groupBy: "day", types: ["access_granted"], start, end } for approvals per day
+  aggregateActivities: async (params: any = {}) => {
+    const { groupBy = "type", start, end, types = [], datasetId, userId, limit = 100 } = params;
+    let url = `/activities/aggregate?group_by=${groupBy}&limit=${limit}`;
+
+    if (start) url += `&start=${encodeURIComponent(start)}`;
+    if (end) url += `&end=${encodeURIComponent(end)}`;
+    for (const type of types) url += `&type=${encodeURIComponent(type)}`;
+    if (datasetId) url += `&dataset_id=${encodeURIComponent(datasetId)}`;
+    if (userId) url += `&user_id=${encodeURIComponent(userId)}`;
+
+    const response = await api.get(url);
+    return response.data;
+  },
+};
+
+// Change feed API
+export const changesAPI = {
+  // Current position, to follow changes from after loading the collections
+  getChangesCursor: async () => {
+    const response = await api.get("/changes");
+    return response.data.last_seq;
+  },
+
+  // Long poll: resolves with the changes after `since` (possibly none after `wait` seconds)
+  getChanges: async (since: number, params: any = {}) => {
+    const { collections = [], wait = 30, limit = 1000 } = params;
+    let url = `/changes?since=${since}&wait=${wait}&limit=${limit}`;
+
+    if (collections.length) url += `&collections=${collections.join(",")}`;
+
+    const response = await api.get(url);
+    return response.data;
+  },
 };
 
 export default {
@@ -148,4 +235,5 @@ export default {
   datasets: datasetAPI,
   accessRequests: accessRequestAPI,
   activities: activityAPI,
+  changes: changesAPI,
 };